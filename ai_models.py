@@ -1,23 +1,39 @@
 \
+from __future__ import annotations
+import os, copy, json, time, pickle, hashlib
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+
+import perf
+
+ARTIFACT_FORMAT = 1
+MODEL_NAMES = ("harvestable_classifier", "care_classifier", "yield_regressor")
+COMPILED_MAX_ROWS = 256
 
 class AFDSAI:
-    def __init__(self, random_state: int = 42):
+    def __init__(self, random_state: int = 42, n_train: int = 12000, train: bool = True):
+        from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor  # ~1s to import; only when models are needed
+        self.random_state = random_state
+        self.n_train = n_train
         self.rng = np.random.default_rng(random_state)
         self.harvestable_classifier = RandomForestClassifier(n_estimators=80, random_state=random_state)
         self.care_classifier = RandomForestClassifier(n_estimators=80, random_state=random_state+1)
         self.yield_regressor = RandomForestRegressor(n_estimators=120, random_state=random_state+2)
-        self._train()
+        self.source = None
+        self.path = None
+        self.backend = "sklearn"
+        self._compiled = None
+        if train:
+            self.train()
 
-    def _synth_row(self, n=12000):
-        ndvi = self.rng.uniform(0, 1, n)
-        moisture = self.rng.uniform(0, 1, n)
-        nutrient = self.rng.uniform(0, 1, n)
-        parasite = np.clip(self.rng.normal(0.1, 0.15, n), 0, 1)
-        canopy_h = self.rng.uniform(0.1, 1.5, n)
-        temp = self.rng.normal(28, 5, n)
-        humidity = self.rng.uniform(40, 90, n)
+    def _synth_row(self, n=12000, rng=None):
+        rng = rng or self.rng
+        ndvi = rng.uniform(0, 1, n)
+        moisture = rng.uniform(0, 1, n)
+        nutrient = rng.uniform(0, 1, n)
+        parasite = np.clip(rng.normal(0.1, 0.15, n), 0, 1)
+        canopy_h = rng.uniform(0.1, 1.5, n)
+        temp = rng.normal(28, 5, n)
+        humidity = rng.uniform(40, 90, n)
         X = np.vstack([ndvi, moisture, nutrient, parasite, canopy_h, temp, humidity]).T
         harvestable = ((ndvi > 0.55) & (parasite < 0.35) & (canopy_h > 0.6)).astype(int)
         care = np.zeros(n, dtype=int)
@@ -29,27 +45,155 @@ class AFDSAI:
         return X, harvestable, care, y
 
     def _train(self):
-        X, y_h, y_c, y_r = self._synth_row(n=12000)
+        X, y_h, y_c, y_r = self._synth_row(n=self.n_train)
         self.harvestable_classifier.fit(X, y_h)
         self.care_classifier.fit(X, y_c)
         self.yield_regressor.fit(X, y_r)
 
-    def predict_all(self, features: np.ndarray) -> dict:
-        X = features.reshape(1, -1)
-        h = int(self.harvestable_classifier.predict(X)[0])
-        c = int(self.care_classifier.predict(X)[0])
-        y = float(self.yield_regressor.predict(X)[0])
-        ndvi, moisture, nutrient, parasite, canopy_h, temp, humidity = features.tolist()
-        water_pct = float(np.clip((0.6 - moisture) * 100, 0, 100))
-        nutrient_pct = float(np.clip((0.7 - nutrient) * 100, 0, 100))
-        fertilizer_pct = float(np.clip((0.65 - (ndvi * 0.8 + nutrient * 0.2)) * 150, 0, 100))
-        parasite_pct = float(np.clip(parasite * 100, 0, 100))
+    def train(self):
+        self.rng = np.random.default_rng(self.random_state)
+        self._train()
+        self._compiled = None
+        self.source = "trained"
+        return self
+
+    def compile(self, validate: bool = True, n_validate: int = 1024):
+        from compiled_forest import CompiledForest
+        models = [getattr(self, name) for name in MODEL_NAMES]
+        compiled = CompiledForest(models)
+        if validate:
+            X, *_ = self._synth_row(n_validate, rng=np.random.default_rng(self.random_state + 1000))
+            compiled.validate(models, X)
+            compiled.validate(models, X[:1])
+        self._compiled = compiled
+        return compiled
+
+    def set_backend(self, backend: str, validate: bool = True):
+        # "compiled" walks flattened trees in NumPy (fast for single rows and small batches),
+        # "auto" uses it up to COMPILED_MAX_ROWS and sklearn's Cython predict above that
+        if backend not in ("sklearn", "compiled", "auto"):
+            raise ValueError(f"Unknown inference backend: {backend}")
+        if backend != "sklearn" and self._compiled is None:
+            self.compile(validate=validate)
+        self.backend = backend
+
+    def artifact_meta(self) -> dict:
+        # everything that changes the fitted trees; a mismatch makes an artifact stale
+        import sklearn
+        return {
+            "format": ARTIFACT_FORMAT,
+            "random_state": self.random_state,
+            "n_train": self.n_train,
+            "sklearn": sklearn.__version__,
+            "params": {name: {k: v for k, v in sorted(getattr(self, name).get_params().items()) if k != "n_jobs"}
+                       for name in MODEL_NAMES},
+        }
+
+    def artifact_key(self) -> str:
+        blob = json.dumps(self.artifact_meta(), sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(blob).hexdigest()[:16]
+
+    def artifact_path(self, directory: str = os.path.join("data", "models")) -> str:
+        return os.path.join(directory, f"afds_models_{self.artifact_key()}.bin")
+
+    def export(self, path: str | None = None) -> str:
+        # layout: one JSON header line (meta + payload digest), then the pickled forests
+        path = path or self.artifact_path()
+        payload = pickle.dumps({name: getattr(self, name) for name in MODEL_NAMES}, protocol=pickle.HIGHEST_PROTOCOL)
+        header = {"key": self.artifact_key(), "meta": self.artifact_meta(),
+                  "sha256": hashlib.sha256(payload).hexdigest(), "size": len(payload)}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(json.dumps(header, sort_keys=True, default=str).encode("utf-8") + b"\n")
+            f.write(payload)
+        os.replace(tmp, path)
+        self.path = path
+        return path
+
+    @classmethod
+    def load(cls, path: str, random_state: int = 42, n_train: int = 12000) -> "AFDSAI":
+        ai = cls(random_state=random_state, n_train=n_train, train=False)
+        with open(path, "rb") as f:
+            header = json.loads(f.readline().decode("utf-8"))
+            payload = f.read()
+        if header.get("key") != ai.artifact_key():
+            raise ValueError(f"Model artifact {path} is stale (key {header.get('key')} != {ai.artifact_key()})")
+        if len(payload) != header.get("size") or hashlib.sha256(payload).hexdigest() != header.get("sha256"):
+            raise ValueError(f"Model artifact {path} failed integrity check")
+        models = pickle.loads(payload)
+        for name in MODEL_NAMES:
+            setattr(ai, name, models[name])
+        ai.source = "artifact"
+        ai.path = path
+        return ai
+
+    @classmethod
+    def load_or_train(cls, directory: str = os.path.join("data", "models"), random_state: int = 42,
+                      n_train: int = 12000) -> "AFDSAI":
+        path = cls(random_state=random_state, n_train=n_train, train=False).artifact_path(directory)
+        if os.path.exists(path):
+            try:
+                return cls.load(path, random_state=random_state, n_train=n_train)
+            except (ValueError, OSError, EOFError, pickle.UnpicklingError) as e:
+                print(f"[WARN] {e}; retraining.")
+        ai = cls(random_state=random_state, n_train=n_train)
+        ai.export(path)
+        return ai
+
+    @perf.timed("ai.predict_batch")
+    def predict_batch(self, features: np.ndarray, chunk_size: int | None = None, n_jobs: int | None = None) -> dict:
+        X = np.asarray(features, dtype=float).reshape(-1, 7)
+        n = X.shape[0]
+        perf.count("ai.rows", n)
+        if self.backend == "compiled" or (self.backend == "auto" and n <= COMPILED_MAX_ROWS):
+            return self._predict_compiled(X, chunk_size)
+        h = np.empty(n, dtype=int); c = np.empty(n, dtype=int); y = np.empty(n, dtype=float)
+        models = [getattr(self, name) for name in MODEL_NAMES]
+        if n_jobs is not None:
+            # shallow copies share the fitted trees; the shared estimators are never mutated,
+            # so concurrent callers with different n_jobs don't race
+            models = [copy.copy(m) for m in models]
+            for m in models: m.n_jobs = n_jobs
+        hc, cc, yr = models
+        step = chunk_size or max(n, 1)
+        for s in range(0, n, step):
+            Xc = X[s:s+step]
+            h[s:s+step] = hc.predict(Xc)
+            c[s:s+step] = cc.predict(Xc)
+            y[s:s+step] = yr.predict(Xc)
+        return self._columns(X, h, c, y)
+
+    def _predict_compiled(self, X: np.ndarray, chunk_size: int | None = None) -> dict:
+        h, c, y = self._compiled.predict(X, chunk_size=chunk_size or 512)
+        return self._columns(X, h.astype(int), c.astype(int), y)
+
+    def _columns(self, X, h, c, y) -> dict:
+        ndvi, moisture, nutrient, parasite = X[:, 0], X[:, 1], X[:, 2], X[:, 3]
         return {
             "harvestable": h,
             "care_label": c,
-            "yield_sqft": max(0.0, y),
-            "water_req_pct": water_pct,
-            "nutrient_req_pct": nutrient_pct,
-            "fertilizer_req_pct": fertilizer_pct,
-            "parasite_pct": parasite_pct
+            "yield_sqft": np.maximum(y, 0.0),
+            "water_req_pct": np.clip((0.6 - moisture) * 100, 0, 100),
+            "nutrient_req_pct": np.clip((0.7 - nutrient) * 100, 0, 100),
+            "fertilizer_req_pct": np.clip((0.65 - (ndvi * 0.8 + nutrient * 0.2)) * 150, 0, 100),
+            "parasite_pct": np.clip(parasite * 100, 0, 100)
         }
+
+    @perf.timed("ai.predict_all")
+    def predict_all(self, features: np.ndarray) -> dict:
+        preds = self.predict_batch(features.reshape(1, -1))
+        return {k: (int(v[0]) if v.dtype.kind == "i" else float(v[0])) for k, v in preds.items()}
+
+if __name__ == "__main__":
+    import argparse
+    p = argparse.ArgumentParser(description="Train and export the AFDS model artifact.")
+    p.add_argument("--random-state", type=int, default=42)
+    p.add_argument("--n-train", type=int, default=12000)
+    p.add_argument("--out", default=None, help="artifact path (default: data/models/afds_models_<key>.bin)")
+    args = p.parse_args()
+    t0 = time.perf_counter()
+    ai = AFDSAI(random_state=args.random_state, n_train=args.n_train)
+    t1 = time.perf_counter()
+    path = ai.export(args.out)
+    print(f"[OK] Trained in {t1 - t0:.2f}s, exported to {path} ({time.perf_counter() - t1:.2f}s)")
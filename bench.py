@@ -0,0 +1,293 @@
+"""Benchmark suite with JSON baselines and regression thresholds.
+
+    python bench.py                          # run everything, compare with bench_baseline.json if present
+    python bench.py --only plan_path,db      # substring filter on benchmark names
+    python bench.py --save-baseline          # record this machine's numbers as the baseline
+    python bench.py --threshold 0.5 --threshold-for ai.train=1.0
+
+Every result is seconds per operation (lower is better); a run fails (exit code 1) when a
+result exceeds its baseline by more than the threshold. All inputs use fixed seeds."""
+from __future__ import annotations
+import os, sys, json, time, shutil, random, tempfile, platform, statistics, subprocess
+import numpy as np
+
+BENCHES = []
+
+def bench(name: str):
+    def wrap(fn):
+        BENCHES.append((name, fn))
+        return fn
+    return wrap
+
+def measure(fn, number: int = 1, repeat: int = 5, warmup: int = 1) -> float:
+    # median over repeats of the mean time per call
+    for _ in range(warmup):
+        fn()
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter() - t0) / number)
+    return statistics.median(runs)
+
+class Suite:
+    """Shared fixtures, built on first use so --only runs stay cheap."""
+
+    def __init__(self, cfg: dict, workdir: str):
+        self.cfg = cfg
+        self.workdir = workdir
+        self._ai = None
+        self._image = None
+
+    @property
+    def seed(self) -> int:
+        return self.cfg["simulation"]["seed"]
+
+    @property
+    def ai(self):
+        if self._ai is None:
+            from ai_models import AFDSAI
+            mcfg = self.cfg.get("models", {})
+            self._ai = AFDSAI.load_or_train(mcfg.get("dir", os.path.join("data", "models")),
+                                            random_state=self.seed, n_train=mcfg.get("n_train", 12000))
+            self._ai.set_backend(mcfg.get("backend", "sklearn"))
+        return self._ai
+
+    @property
+    def image(self) -> str:
+        if self._image is None:
+            from vision import synthesize_uhd_field
+            path = os.path.join("data", "uhd_field.png")
+            if not os.path.exists(path):
+                path = synthesize_uhd_field(save_path=os.path.join(self.workdir, "uhd_field.png"), seed=self.seed)
+            self._image = path
+        return self._image
+
+    def field(self):
+        from field import FieldConfig, FieldGrid
+        return FieldGrid(FieldConfig(**self.cfg["field"]))
+
+    def sandbox(self) -> str:
+        """A copy of the config whose DB, raster and caches live in workdir (models are shared
+        read-only), so benchmarks neither touch the user's state nor depend on what it has cached."""
+        path = os.path.join(self.workdir, "config.json")
+        if not os.path.exists(path):
+            cfg = json.loads(json.dumps(self.cfg))
+            mcfg = cfg.setdefault("models", {})
+            mcfg["dir"] = os.path.abspath(mcfg.get("dir", os.path.join("data", "models")))
+            cfg["database"]["path"] = os.path.join(self.workdir, "afds.sqlite3")
+            cfg.setdefault("raster", {})["dir"] = os.path.join(self.workdir, "data", "raster")
+            os.makedirs(os.path.join(self.workdir, "data"), exist_ok=True)
+            shutil.copyfile(self.image, os.path.join(self.workdir, "data", "uhd_field.png"))
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(cfg, f, indent=2)
+        return path
+
+# --- benchmarks: each yields (name, seconds per op, ops per measurement) -----------------
+
+@bench("features")
+def bench_features(s: Suite):
+    from utils import deterministic_features_for_cell, deterministic_features_for_bbox
+    rng = np.random.default_rng(s.seed)
+    cells = rng.integers(0, 4096, size=(500, 2)).tolist()
+    yield "features.cell", measure(lambda: [deterministic_features_for_cell(x, y) for x, y in cells]) / len(cells), 1
+    yield "features.bbox_256", measure(lambda: deterministic_features_for_bbox(0, 0, 256, 256)), 256 * 256
+
+@bench("ai")
+def bench_ai(s: Suite):
+    from utils import deterministic_features_for_bbox
+    ai = s.ai
+    for backend in ("sklearn", "compiled"):
+        ai.set_backend(backend)
+        row = deterministic_features_for_bbox(7, 9, 8, 10).reshape(7)
+        yield f"ai.single.{backend}", measure(lambda: ai.predict_all(row), number=20), 1
+    ai.set_backend("sklearn")
+    X = deterministic_features_for_bbox(0, 0, 256, 256).reshape(-1, 7)
+    yield "ai.batch_65536", measure(lambda: ai.predict_batch(X, chunk_size=8192), repeat=3), len(X)
+    ai.set_backend(s.cfg.get("models", {}).get("backend", "sklearn"))
+
+@bench("ai.train")
+def bench_train(s: Suite):
+    from ai_models import AFDSAI
+    n = s.cfg.get("models", {}).get("n_train", 12000)
+    yield "ai.train", measure(lambda: AFDSAI(random_state=s.seed, n_train=n), repeat=1, warmup=0), 1
+
+@bench("recognition")
+def bench_recognition(s: Suite):
+    from vision import simple_object_recognition
+    path = s.image
+    yield "recognition.bins", measure(lambda: simple_object_recognition(path), repeat=3), 1
+    yield "recognition.components", measure(lambda: simple_object_recognition(path, mode="components"), repeat=3), 1
+
+@bench("plan_path")
+def bench_plan_path(s: Suite):
+    from drone import DroneSimulator
+    f = s.cfg["field"]
+    rng = random.Random(s.seed)
+    scattered = []
+    for _ in range(400):
+        x, y = rng.randrange(f["max_x"]), rng.randrange(f["max_y"])
+        scattered.append([x, y, x + rng.randint(10, 200), y + rng.randint(10, 200)])
+    layouts = {"config": s.cfg["simulation"].get("obstacles", []), "scattered400": scattered}
+    for layout, obstacles in layouts.items():
+        sim = DroneSimulator(f["max_x"], f["max_y"], obstacles)
+        start, goal = (0, 0), (f["max_x"] - 1, f["max_y"] - 1)
+        for mode in ("astar", "jps", "hierarchical"):
+            if layout == "scattered400" and mode == "astar":
+                continue  # ~8s per run; jps covers exact search on this layout
+            sim.plan_path(start, goal, mode)  # first call builds the lazy per-mode tables
+            yield f"plan_path.{layout}.{mode}", measure(lambda: sim.plan_path(start, goal, mode), repeat=3, warmup=0), 1
+    sim = DroneSimulator(f["max_x"], f["max_y"], layouts["config"])
+    targets = [(rng.randrange(f["max_x"]), rng.randrange(f["max_y"])) for _ in range(300)]
+    targets = [t for t in targets if not sim.is_blocked(*t)]
+    sim.route_distances([(0, 0)])
+    yield "plan_mission.300", measure(lambda: sim.plan_mission(targets), repeat=3), 1
+    # above CORNER_TABLE_MAX corners route lengths come from per-point corner searches; a fresh
+    # simulator per run, so the timing includes everything a first mission pays
+    sim = DroneSimulator(f["max_x"], f["max_y"], scattered)
+    targets = [t for t in targets if not sim.is_blocked(*t)]
+    yield "plan_mission.300.scattered400", measure(
+        lambda: DroneSimulator(f["max_x"], f["max_y"], scattered).plan_mission(targets), repeat=1, warmup=0), 1
+
+@bench("db")
+def bench_db(s: Suite):
+    from database import DB
+    feats = [0.5, 0.4, 0.3, 0.1, 1.0, 27.0, 60.0]
+    preds = {"harvestable": 1, "yield_sqft": 0.5, "water_req_pct": 10.0, "nutrient_req_pct": 5.0,
+             "fertilizer_req_pct": 0.0, "parasite_pct": 10.0}
+    n = 2000
+    for label, kw in (("sync", {}), ("write_behind", {"write_behind": True})):
+        path = os.path.join(s.workdir, f"bench_{label}.sqlite3")
+        with DB(path, **kw) as db:
+            def insert():
+                for i in range(n):
+                    db.log_observation(i % 4096, i // 4096, 23.8, 90.4, feats, preds)
+                db.flush()
+            yield f"db.insert.{label}", measure(insert, repeat=3) / n, 1
+
+@bench("cmd_metrics")
+def bench_cmd_metrics(s: Suite):
+    import io, contextlib
+    from main import cmd_metrics
+    from database import DB
+    from raster import FieldRaster
+    field = s.field()
+    # empty raster in workdir: every run samples the same cold cells
+    raster = FieldRaster(field, s.ai, root=os.path.join(s.workdir, "metrics_raster"), tile=s.cfg.get("raster", {}).get("tile", 256))
+    with DB(os.path.join(s.workdir, "bench_metrics.sqlite3")) as db:
+        with contextlib.redirect_stdout(io.StringIO()):
+            seconds = measure(lambda: cmd_metrics(field, raster, db, s.cfg, "sample"), repeat=3)
+        yield "cmd_metrics.sample", seconds, 1
+
+@bench("startup")
+def bench_startup(s: Suite):
+    # fresh interpreter in the sandbox with warm caches (the artifact, image and recognition
+    # exist by now): time to the first prompt, and to the first answered query (which loads
+    # the models and fills one raster tile)
+    s.ai
+    config = s.sandbox()
+    prompt = ("import io, contextlib, main; from utils import load_config\n"
+              "with contextlib.redirect_stdout(io.StringIO()):\n"
+              f"    ctx = main.make_context(load_config({config!r}))\n")
+    query = ("with contextlib.redirect_stdout(io.StringIO()):\n"
+             "    main.dispatch(ctx, 'situation', {'x': 33, 'y': 33})\n")
+    close = "main.close_context(ctx)\n"
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")])))
+    raster_dir = os.path.join(s.workdir, "data", "raster")
+    def run(code):
+        shutil.rmtree(raster_dir, ignore_errors=True)  # same cold tile for every query run
+        subprocess.run([sys.executable, "-c", code], check=True, stdout=subprocess.DEVNULL, cwd=s.workdir, env=env)
+    run(prompt + close)  # fills the recognition cache if this image hasn't been seen
+    yield "startup.first_prompt", measure(lambda: run(prompt + close), repeat=3), 1
+    yield "startup.first_query", measure(lambda: run(prompt + query + close), repeat=3), 1
+
+# --- runner ----------------------------------------------------------------------------
+
+def environment() -> dict:
+    import sklearn
+    return {"python": platform.python_version(), "numpy": np.__version__, "sklearn": sklearn.__version__,
+            "machine": platform.machine(), "processor": platform.processor() or platform.machine(),
+            "cpus": os.cpu_count()}
+
+def run(cfg: dict, only=None) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="afds-bench-") as workdir:
+        suite = Suite(cfg, workdir)
+        for group, fn in BENCHES:
+            if only and not any(pat in group for pat in only):
+                continue
+            for name, seconds, ops in fn(suite):
+                results[name] = {"seconds": seconds, "ops": ops}
+                rate = f"{ops / seconds:,.{0 if ops / seconds >= 100 else 2}f}/s" if seconds else "-"
+                print(f"  {name:<34} {seconds * 1e3:>11.3f} ms  {rate:>14}", flush=True)
+    return results
+
+def compare(results: dict, baseline: dict, threshold: float, per_bench: dict) -> list:
+    failures = []
+    print(f"\n  {'benchmark':<34} {'baseline':>11}    {'now':>11}    {'change':>7}")
+    for name, r in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            print(f"  {name:<34} {'-':>11}    {r['seconds'] * 1e3:>11.3f}ms   new")
+            continue
+        change = r["seconds"] / base["seconds"] - 1 if base["seconds"] else 0.0
+        limit = per_bench.get(name, threshold)
+        flag = "  REGRESSION" if change > limit else ""
+        print(f"  {name:<34} {base['seconds'] * 1e3:>11.3f}ms {r['seconds'] * 1e3:>11.3f}ms {change:>+7.1%}{flag}")
+        if flag:
+            failures.append((name, change, limit))
+    return failures
+
+def main(argv=None) -> int:
+    import argparse
+    from utils import load_config
+    cfg = load_config("config.json")
+    bcfg = cfg.get("bench", {})
+    ap = argparse.ArgumentParser(description="AFDS benchmark suite")
+    ap.add_argument("--only", default="", help="comma-separated substrings of benchmark groups to run")
+    ap.add_argument("--baseline", default=bcfg.get("baseline", "bench_baseline.json"))
+    ap.add_argument("--save-baseline", action="store_true", help="write this run as the new baseline")
+    ap.add_argument("--threshold", type=float, default=bcfg.get("threshold", 0.25),
+                    help="allowed slowdown as a fraction of the baseline (default 0.25)")
+    ap.add_argument("--threshold-for", action="append", default=[], metavar="NAME=FRACTION",
+                    help="per-benchmark threshold override (repeatable)")
+    ap.add_argument("--json", default=None, help="also write this run's results to a JSON file")
+    opts = ap.parse_args(argv)
+    per_bench = dict(bcfg.get("thresholds", {}))
+    for item in opts.threshold_for:
+        name, _, frac = item.partition("=")
+        per_bench[name] = float(frac)
+    only = [p for p in opts.only.split(",") if p]
+    print(f"[BENCH] {len(BENCHES)} groups, seed {cfg['simulation']['seed']}")
+    doc = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "env": environment(), "results": run(cfg, only)}
+    if opts.json:
+        with open(opts.json, "w", encoding="utf-8") as f:
+            json.dump(doc, f, indent=2)
+    if opts.save_baseline:
+        if os.path.exists(opts.baseline) and only:
+            with open(opts.baseline, encoding="utf-8") as f:
+                old = json.load(f)
+            old["results"].update(doc["results"])  # partial runs refresh only what they measured
+            doc = {**old, "created": doc["created"], "env": doc["env"]}
+        with open(opts.baseline, "w", encoding="utf-8") as f:
+            json.dump(doc, f, indent=2)
+        print(f"[OK] Baseline written to {opts.baseline}")
+        return 0
+    if not os.path.exists(opts.baseline):
+        print(f"[INFO] No baseline at {opts.baseline}; run with --save-baseline to create one.")
+        return 0
+    with open(opts.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("env") != doc["env"]:
+        print(f"[WARN] Baseline was recorded on a different environment: {baseline.get('env')}")
+    failures = compare(doc["results"], baseline, opts.threshold, per_bench)
+    if failures:
+        print(f"\n[FAIL] {len(failures)} regression(s): " +
+              ", ".join(f"{n} {c:+.0%} (limit {l:+.0%})" for n, c, l in failures))
+        return 1
+    print("\n[OK] No regressions.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
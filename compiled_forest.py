@@ -0,0 +1,105 @@
+from __future__ import annotations
+import numpy as np
+
+class CompiledForest:
+    """Trees of several fitted sklearn forests flattened into contiguous node arrays.
+
+    All trees of all models are walked together in one vectorized traversal; the
+    per-model reduction then mirrors sklearn's (sequential sum over trees, divide,
+    argmax for classifiers) so outputs match ``model.predict`` exactly for finite inputs
+    (sklearn's missing-value routing is not reproduced)."""
+
+    def __init__(self, models):
+        feature, threshold, left, right, leaf, values = [], [], [], [], [], []
+        self.roots, self.slices, self.classes = [], [], []
+        width = max(len(getattr(m, "classes_", [0])) for m in models)
+        offset = 0
+        for m in models:
+            first = len(self.roots)
+            classifier = hasattr(m, "classes_")
+            for est in m.estimators_:
+                t = est.tree_
+                n = t.node_count
+                is_leaf = t.children_left == -1
+                own = np.arange(n) + offset
+                feature.append(np.where(is_leaf, 0, t.feature).astype(np.int32))
+                threshold.append(t.threshold.astype(np.float64))
+                # leaves point at themselves so extra steps are harmless
+                left.append(np.where(is_leaf, own, t.children_left + offset).astype(np.int32))
+                right.append(np.where(is_leaf, own, t.children_right + offset).astype(np.int32))
+                leaf.append(is_leaf)
+                v = np.array(t.value[:, 0, :], dtype=np.float64)
+                if classifier:
+                    # sklearn < 1.4 stores class counts and normalizes in predict_proba
+                    s = v.sum(axis=1, keepdims=True)
+                    if not np.allclose(s[is_leaf], 1.0):
+                        s[s == 0.0] = 1.0
+                        v /= s
+                values.append(np.pad(v, ((0, 0), (0, width - v.shape[1]))))
+                self.roots.append(offset)
+                offset += n
+            self.slices.append((first, len(self.roots)))
+            self.classes.append(m.classes_ if classifier else None)
+        self.feature = np.concatenate(feature)
+        self.threshold = np.concatenate(threshold)
+        self.children = np.stack([np.concatenate(left), np.concatenate(right)], axis=1).reshape(-1)
+        self.leaf = np.concatenate(leaf)
+        self.values = np.concatenate(values)
+        self.roots = np.array(self.roots, dtype=np.int32)
+        self.max_depth = max(est.tree_.max_depth for m in models for est in m.estimators_)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    def apply(self, X: np.ndarray, chunk_size: int = 512) -> np.ndarray:
+        # sklearn casts inputs to float32 before comparing against float64 thresholds
+        Xf = np.asarray(X, dtype=np.float32).reshape(len(X), -1).astype(np.float64)
+        n, T = Xf.shape[0], len(self.roots)
+        leaves = np.empty((n, T), dtype=np.int32)
+        if n == 1:
+            # single row: fixed-depth walk, leaves loop on themselves so no compaction needed
+            x, nodes = Xf[0], self.roots
+            for _ in range(self.max_depth):
+                nodes = self.children[2*nodes + (x[self.feature[nodes]] > self.threshold[nodes])]
+            leaves[0] = nodes
+            return leaves
+        flat = Xf.reshape(-1)
+        for s in range(0, n, chunk_size):
+            e = min(n, s + chunk_size)
+            out = leaves[s:e].reshape(-1)
+            base = np.repeat(np.arange(s, e) * Xf.shape[1], T)
+            nodes = np.tile(self.roots, e - s)
+            slot = np.arange(len(nodes))
+            step = 0
+            while True:
+                if step % 4 == 0:  # compacting every step costs more than the few wasted leaf steps
+                    done = self.leaf[nodes]
+                    if done.any():
+                        out[slot[done]] = nodes[done]
+                        keep = ~done
+                        base, nodes, slot = base[keep], nodes[keep], slot[keep]
+                    if not len(nodes):
+                        break
+                step += 1
+                go_right = flat[base + self.feature[nodes]] > self.threshold[nodes]
+                nodes = self.children[2*nodes + go_right]
+        return leaves
+
+    def predict(self, X: np.ndarray, chunk_size: int = 512) -> list:
+        leaves = self.apply(X, chunk_size=chunk_size)
+        out = []
+        for (a, b), classes in zip(self.slices, self.classes):
+            w = len(classes) if classes is not None else 1
+            # cumsum accumulates tree by tree like sklearn does (add.reduce may sum pairwise)
+            acc = np.cumsum(self.values[leaves[:, a:b].T, :w], axis=0)[-1]
+            acc /= (b - a)
+            out.append(classes.take(np.argmax(acc, axis=1)) if classes is not None else acc[:, 0])
+        return out
+
+    def validate(self, models, X: np.ndarray):
+        for i, (m, got) in enumerate(zip(models, self.predict(X))):
+            want = m.predict(X)
+            if not np.array_equal(got, want):
+                bad = int(np.count_nonzero(got != want))
+                raise ValueError(f"Compiled forest #{i} disagrees with sklearn on {bad}/{len(X)} rows")
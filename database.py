@@ -1,6 +1,10 @@
 \
-import sqlite3
-from datetime import datetime
+from __future__ import annotations
+import json, time, queue, sqlite3, threading
+from datetime import date, datetime
+from itertools import groupby
+
+import perf
 
 SCHEMA = """
 PRAGMA journal_mode=WAL;
@@ -28,40 +32,357 @@ CREATE TABLE IF NOT EXISTS metrics (
   ts TEXT,
   total_harvest_potential REAL,
   efficiency_vs_prev_pct REAL,
-  avg_yield_per_sqft REAL
+  avg_yield_per_sqft REAL,
+  mode TEXT, tracked_tiles INTEGER, samples INTEGER
+);
+CREATE TABLE IF NOT EXISTS perf (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  ts TEXT,
+  name TEXT, kind TEXT, unit TEXT,
+  count INTEGER, sum REAL,
+  p50 REAL, p95 REAL, p99 REAL, max REAL
+);
+CREATE TABLE IF NOT EXISTS tile_metrics (
+  source TEXT, tile_x INTEGER, tile_y INTEGER,
+  cells INTEGER, harvestable INTEGER, yield_sum REAL, care_hist TEXT,
+  PRIMARY KEY (source, tile_x, tile_y)
+);
+CREATE INDEX IF NOT EXISTS idx_observations_xy ON observations (x, y);
+CREATE INDEX IF NOT EXISTS idx_observations_ts ON observations (ts);
+CREATE INDEX IF NOT EXISTS idx_actions_xy ON actions (x, y);
+CREATE INDEX IF NOT EXISTS idx_actions_ts ON actions (ts);
+CREATE INDEX IF NOT EXISTS idx_actions_type_ts ON actions (type, ts);
+"""
+
+# per-tile/per-day rollups, maintained by triggers so both the synchronous and the
+# write-behind paths keep them current inside the inserting transaction
+ROLLUP_TILE = 256
+ROLLUP_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS observation_rollup (
+  tile_x INTEGER, tile_y INTEGER, day TEXT,
+  n INTEGER, harvestable_n INTEGER, yield_sum REAL,
+  water_sum REAL, nutrient_sum REAL, fertilizer_sum REAL, parasite_sum REAL,
+  PRIMARY KEY (tile_x, tile_y, day)
+);
+CREATE TABLE IF NOT EXISTS action_rollup (
+  tile_x INTEGER, tile_y INTEGER, day TEXT, type TEXT,
+  n INTEGER, kg_sum REAL,
+  PRIMARY KEY (tile_x, tile_y, day, type)
 );
+CREATE TRIGGER IF NOT EXISTS trg_observation_rollup AFTER INSERT ON observations BEGIN
+  INSERT INTO observation_rollup VALUES (
+    NEW.x / {ROLLUP_TILE}, NEW.y / {ROLLUP_TILE}, substr(NEW.ts, 1, 10), 1, NEW.harvestable, NEW.yield_sqft,
+    NEW.water_req_pct, NEW.nutrient_req_pct, NEW.fertilizer_req_pct, NEW.parasite_pct)
+  ON CONFLICT (tile_x, tile_y, day) DO UPDATE SET
+    n = n + 1, harvestable_n = harvestable_n + excluded.harvestable_n, yield_sum = yield_sum + excluded.yield_sum,
+    water_sum = water_sum + excluded.water_sum, nutrient_sum = nutrient_sum + excluded.nutrient_sum,
+    fertilizer_sum = fertilizer_sum + excluded.fertilizer_sum, parasite_sum = parasite_sum + excluded.parasite_sum;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_action_rollup AFTER INSERT ON actions BEGIN
+  INSERT INTO action_rollup VALUES (
+    NEW.x / {ROLLUP_TILE}, NEW.y / {ROLLUP_TILE}, substr(NEW.ts, 1, 10), NEW.type, 1, coalesce(NEW.kg, 0))
+  ON CONFLICT (tile_x, tile_y, day, type) DO UPDATE SET n = n + 1, kg_sum = kg_sum + excluded.kg_sum;
+END;
 """
 
+_REBUILD_ROLLUPS = f"""
+DELETE FROM observation_rollup;
+INSERT INTO observation_rollup
+  SELECT x / {ROLLUP_TILE}, y / {ROLLUP_TILE}, substr(ts, 1, 10), count(*), sum(harvestable), sum(yield_sqft),
+         sum(water_req_pct), sum(nutrient_req_pct), sum(fertilizer_req_pct), sum(parasite_pct)
+  FROM observations GROUP BY 1, 2, 3;
+DELETE FROM action_rollup;
+INSERT INTO action_rollup
+  SELECT x / {ROLLUP_TILE}, y / {ROLLUP_TILE}, substr(ts, 1, 10), type, count(*), sum(coalesce(kg, 0))
+  FROM actions GROUP BY 1, 2, 3, 4;
+"""
+
+_OBS_SQL = """INSERT INTO observations
+            (ts,x,y,lat,lon,ndvi,moisture,nutrient,parasite,canopy_h,harvestable,yield_sqft,water_req_pct,nutrient_req_pct,fertilizer_req_pct,parasite_pct,temp_c,humidity_pct)
+            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)"""
+_ACTION_SQL = """INSERT INTO actions (ts,type,x,y,kg,notes) VALUES (?,?,?,?,?,?)"""
+_METRICS_SQL = """INSERT INTO metrics (ts,total_harvest_potential,efficiency_vs_prev_pct,avg_yield_per_sqft,
+                                      mode,tracked_tiles,samples)
+                             VALUES (?,?,?,?,?,?,?)"""
+# columns added after the first release; older databases get them on open
+_MIGRATIONS = {"metrics": (("mode", "TEXT"), ("tracked_tiles", "INTEGER"), ("samples", "INTEGER"))}
+_TILE_METRICS_SQL = """INSERT OR REPLACE INTO tile_metrics (source,tile_x,tile_y,cells,harvestable,yield_sum,care_hist)
+                                   VALUES (?,?,?,?,?,?,?)"""
+_PERF_SQL = """INSERT INTO perf(ts,name,kind,unit,count,sum,p50,p95,p99,max) VALUES (?,?,?,?,?,?,?,?,?,?)"""
+SYNCHRONOUS_LEVELS = ("OFF", "NORMAL", "FULL", "EXTRA")
+_STOP = object()
+
 class DB:
-    def __init__(self, path: str):
+    """SQLite store. By default every write commits immediately.
+
+    write_behind=True queues writes for a background thread that inserts them with
+    executemany and commits once per batch_rows rows or flush_interval seconds,
+    whichever comes first. flush() blocks until everything queued so far is committed.
+    A failed batch stays queued for the next commit, and its error is raised from the next
+    flush(), close() or write."""
+
+    def __init__(self, path: str, write_behind: bool = False, batch_rows: int = 500,
+                 flush_interval: float = 0.5, synchronous: str | None = None):
+        self.path = path
         self.conn = sqlite3.connect(path, check_same_thread=False)
+        self._reader = None
+        self._lock = threading.Lock()
+        if synchronous is not None:
+            if synchronous.upper() not in SYNCHRONOUS_LEVELS:
+                raise ValueError(f"synchronous must be one of {SYNCHRONOUS_LEVELS}")
+            self.conn.execute(f"PRAGMA synchronous={synchronous.upper()}")
         self._init()
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self._queue = None
+        self._thread = None
+        self._error = None  # last write-behind failure, raised to the next caller
+        if write_behind:
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._writer, name="afds-db-writer", daemon=True)
+            self._thread.start()
 
     def _init(self):
         self.conn.executescript(SCHEMA)
+        for table, columns in _MIGRATIONS.items():
+            have = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            for name, type_ in columns:
+                if name not in have:
+                    self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {type_}")
+        fresh = self.conn.execute("SELECT name FROM sqlite_master WHERE name = 'observation_rollup'").fetchone() is None
+        self.conn.executescript(ROLLUP_SCHEMA)
+        if fresh:  # database predates the rollups: backfill once from raw rows
+            self.conn.executescript(_REBUILD_ROLLUPS)
         self.conn.commit()
 
+    def rebuild_rollups(self):
+        self.flush()
+        with self._lock:
+            self.conn.executescript("BEGIN;" + _REBUILD_ROLLUPS + "COMMIT;")
+
+    def _raise_error(self):
+        if self._error is not None:
+            e, self._error = self._error, None
+            raise e
+
+    def _write(self, sql, row):
+        self._raise_error()
+        perf.count("db.rows")
+        if self._queue is not None:
+            self._queue.put((sql, row))
+            return
+        with perf.timer("db.commit"), self._lock:
+            self.conn.execute(sql, row)
+            self.conn.commit()
+
+    def _write_many(self, sql, rows):
+        # one transaction (or one queue burst) for the whole batch
+        self._raise_error()
+        perf.count("db.rows", len(rows))
+        if self._queue is not None:
+            for row in rows:
+                self._queue.put((sql, row))
+            return
+        with perf.timer("db.commit"), self._lock, self.conn:
+            self.conn.executemany(sql, rows)
+
+    def _commit(self, pending) -> bool:
+        # on failure the rows stay in pending (the transaction rolled back) and are retried
+        try:
+            with perf.timer("db.commit"), self._lock, self.conn:
+                for sql, group in groupby(pending, key=lambda item: item[0]):
+                    self.conn.executemany(sql, [row for _, row in group])
+        except sqlite3.Error as e:
+            print(f"[WARN] DB write-behind batch of {len(pending)} rows failed (kept for retry): {e}")
+            self._error = e
+            return False
+        pending.clear()
+        return True
+
+    def _writer(self):
+        pending, deadline, retry_at = [], None, 0.0
+        while True:
+            timeout = None if not pending else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self._commit(pending)
+                return
+            if isinstance(item, threading.Event):
+                self._commit(pending)
+                item.set()
+                continue
+            if item is not None:
+                if not pending:
+                    deadline = time.monotonic() + self.flush_interval
+                pending.append(item)
+            now = time.monotonic()
+            due = len(pending) >= self.batch_rows or (pending and now >= deadline)
+            if due and now >= retry_at and not self._commit(pending):
+                retry_at = deadline = time.monotonic() + self.flush_interval  # back off before retrying
+
+    def flush(self):
+        if self._thread is not None and self._thread.is_alive():
+            done = threading.Event()
+            self._queue.put(done)
+            done.wait()
+        self._raise_error()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+            self._queue = None
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        self._raise_error()  # rows of a batch that failed on the last commit were not written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
     def log_observation(self, x,y,lat,lon, feats, preds):
         ts = datetime.utcnow().isoformat()
-        self.conn.execute("""INSERT INTO observations
-            (ts,x,y,lat,lon,ndvi,moisture,nutrient,parasite,canopy_h,harvestable,yield_sqft,water_req_pct,nutrient_req_pct,fertilizer_req_pct,parasite_pct,temp_c,humidity_pct)
-            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)""",
+        self._write(_OBS_SQL,
             (ts,x,y,lat,lon,
              feats[0],feats[1],feats[2],feats[3],feats[4],
              preds["harvestable"],preds["yield_sqft"],
              preds["water_req_pct"],preds["nutrient_req_pct"],preds["fertilizer_req_pct"],preds["parasite_pct"],
              feats[5],feats[6]))
-        self.conn.commit()
+
+    def log_observations(self, xs, ys, lats, lons, feats, preds):
+        # bulk form of log_observation
+        ts = datetime.utcnow().isoformat()
+        cols = [c.tolist() if hasattr(c, "tolist") else list(c) for c in
+                (xs, ys, lats, lons, feats[:, 0], feats[:, 1], feats[:, 2], feats[:, 3], feats[:, 4],
+                 preds["harvestable"], preds["yield_sqft"], preds["water_req_pct"], preds["nutrient_req_pct"],
+                 preds["fertilizer_req_pct"], preds["parasite_pct"], feats[:, 5], feats[:, 6])]
+        self._write_many(_OBS_SQL, [(ts,) + row for row in zip(*cols)])
 
     def log_action(self, type_, x,y,kg=None, notes=""):
         ts = datetime.utcnow().isoformat()
-        self.conn.execute("""INSERT INTO actions (ts,type,x,y,kg,notes) VALUES (?,?,?,?,?,?)""",
-                          (ts,type_,x,y,kg,notes))
-        self.conn.commit()
+        self._write(_ACTION_SQL, (ts,type_,x,y,kg,notes))
 
-    def write_metrics(self, total_harvest_potential, efficiency_vs_prev_pct, avg_yield_per_sqft):
+    def write_metrics(self, total_harvest_potential, efficiency_vs_prev_pct, avg_yield_per_sqft,
+                      mode=None, tracked_tiles=None, samples=None):
+        # mode/tracked_tiles/samples describe the estimator, so later snapshots compare like with like
         ts = datetime.utcnow().isoformat()
-        self.conn.execute("""INSERT INTO metrics (ts,total_harvest_potential,efficiency_vs_prev_pct,avg_yield_per_sqft)
-                             VALUES (?,?,?,?)""",
-                          (ts,total_harvest_potential,efficiency_vs_prev_pct,avg_yield_per_sqft))
-        self.conn.commit()
+        self._write(_METRICS_SQL, (ts,total_harvest_potential,efficiency_vs_prev_pct,avg_yield_per_sqft,
+                                   mode,tracked_tiles,samples))
+
+    def write_tile_metrics(self, source: str, rows):
+        # rows: (tile_x, tile_y, cells, harvestable, yield_sum, care_hist); care_hist is a list of counts
+        self._write_many(_TILE_METRICS_SQL, [(source, tx, ty, n, h, ys, json.dumps([int(c) for c in care]))
+                                             for tx, ty, n, h, ys, care in rows])
+
+    def purge_metrics_state(self, keep_source: str):
+        # tile aggregates of other rasters (older models or field configs) no longer apply
+        self.flush()
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM tile_metrics WHERE source != ?", (keep_source,))
+
+    def write_perf(self, rows):
+        # rows: (ts, name, kind, unit, count, sum, p50, p95, p99, max), see perf.export_sqlite
+        self.flush()
+        with self._lock, self.conn:
+            self.conn.executemany(_PERF_SQL, rows)
+
+    # --- reads ---------------------------------------------------------------------
+
+    def _read_conn(self):
+        # WAL lets a second connection read while the writer commits; :memory: can't be shared
+        if self.path == ":memory:":
+            return self.conn
+        if self._reader is None:
+            self._reader = sqlite3.connect(self.path, check_same_thread=False)
+        return self._reader
+
+    def query(self, sql, params=(), batch: int = 1000):
+        # stream rows as dicts; queued write-behind rows are flushed first
+        self.flush()
+        cur = self._read_conn().execute(sql, params)
+        cols = [c[0] for c in cur.description]
+        try:
+            while True:
+                rows = cur.fetchmany(batch)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(zip(cols, row))
+        finally:
+            cur.close()
+
+    @staticmethod
+    def _filters(bbox=None, since=None, until=None, type_=None, ts_col="ts", x_col="x", y_col="y"):
+        clauses, params = [], []
+        if bbox is not None:
+            x1, y1, x2, y2 = bbox
+            clauses.append(f"{x_col} BETWEEN ? AND ? AND {y_col} BETWEEN ? AND ?")
+            params += [x1, x2, y1, y2]
+        if since is not None:
+            clauses.append(f"{ts_col} >= ?"); params.append(_ts(since))
+        if until is not None:
+            clauses.append(f"{ts_col} < ?"); params.append(_ts(until))
+        if type_ is not None:
+            clauses.append("type = ?"); params.append(type_)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def observations(self, bbox=None, since=None, until=None, newest_first: bool = False, limit: int | None = None):
+        # bbox is (x1, y1, x2, y2) inclusive, like obstacle rectangles
+        where, params = self._filters(bbox, since, until)
+        sql = f"SELECT * FROM observations{where} ORDER BY ts {'DESC' if newest_first else 'ASC'}, id"
+        if limit is not None:
+            sql += " LIMIT ?"; params.append(limit)
+        return self.query(sql, params)
+
+    def observations_at(self, x: int, y: int, since=None, until=None, newest_first: bool = True, limit: int | None = None):
+        return self.observations((x, y, x, y), since, until, newest_first, limit)
+
+    def last_observation(self, x: int, y: int):
+        return next(self.observations_at(x, y, limit=1), None)
+
+    def actions(self, bbox=None, type_: str | None = None, since=None, until=None,
+                newest_first: bool = False, limit: int | None = None):
+        where, params = self._filters(bbox, since, until, type_)
+        sql = f"SELECT * FROM actions{where} ORDER BY ts {'DESC' if newest_first else 'ASC'}, id"
+        if limit is not None:
+            sql += " LIMIT ?"; params.append(limit)
+        return self.query(sql, params)
+
+    def last_metrics(self, mode=None, tracked_tiles=None, samples=None):
+        # latest snapshot taken the same way (same mode, tile coverage and sample size)
+        return next(self.query("""SELECT * FROM metrics WHERE mode IS ? AND tracked_tiles IS ? AND samples IS ?
+                                  ORDER BY id DESC LIMIT 1""", (mode, tracked_tiles, samples)), None)
+
+    def tile_metrics(self, source: str):
+        for row in self.query("SELECT * FROM tile_metrics WHERE source = ? ORDER BY tile_y, tile_x", (source,)):
+            row["care_hist"] = json.loads(row["care_hist"])
+            yield row
+
+    def observation_rollups(self, tile_bbox=None, since_day=None, until_day=None):
+        # per (tile, day): counts plus mean yield and mean requirement percentages
+        where, params = self._filters(tile_bbox, since_day, until_day, ts_col="day", x_col="tile_x", y_col="tile_y")
+        return self.query(f"""SELECT tile_x, tile_y, day, n, harvestable_n, yield_sum / n AS mean_yield,
+                                     water_sum / n AS mean_water_req_pct, nutrient_sum / n AS mean_nutrient_req_pct,
+                                     fertilizer_sum / n AS mean_fertilizer_req_pct, parasite_sum / n AS mean_parasite_pct
+                              FROM observation_rollup{where} ORDER BY day, tile_y, tile_x""", params)
+
+    def action_rollups(self, tile_bbox=None, type_: str | None = None, since_day=None, until_day=None):
+        where, params = self._filters(tile_bbox, since_day, until_day, type_, ts_col="day", x_col="tile_x", y_col="tile_y")
+        return self.query(f"SELECT * FROM action_rollup{where} ORDER BY day, type, tile_y, tile_x", params)
+
+def _ts(value) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
@@ -1,8 +1,17 @@
 \
 from __future__ import annotations
+import copy
 import heapq
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass
 from typing import List, Tuple, Optional
+import numpy as np
+
+import perf
+
+# corners (K) up to which the hierarchical planner tabulates all-pairs corner routes; Floyd-Warshall
+# is O(K³), a few ms at this size. Grids with more corners plan with JPS instead
+CORNER_TABLE_MAX = 256
 
 @dataclass
 class DroneState:
@@ -10,6 +19,17 @@ class DroneState:
     y: int = 0
     battery_pct: float = 100.0
 
+@dataclass
+class Mission:
+    targets: List[Tuple[int,int]]
+    sorties: List[List[int]]   # target indices in visit order; every sortie after the first starts at base
+    skipped: List[int]         # unreachable, or out of range of a full battery from base
+    distance: int              # planned cells flown, including returns to base
+
+    @property
+    def order(self) -> List[int]:
+        return [i for sortie in self.sorties for i in sortie]
+
 class DroneAPI:
     def go_to(self, x: int, y: int, lat: float, lon: float):
         print(f"[DRONE] Navigating to cell ({x},{y}) @ lat={lat:.6f}, lon={lon:.6f}")
@@ -21,13 +41,53 @@ class DroneAPI:
         print("[DRONE] Collecting soil sample...")
 
 class DroneSimulator:
-    def __init__(self, max_x: int, max_y: int, obstacles: List[Tuple[int,int,int,int]] | None = None):
-        self.state = DroneState()
+    """Grid planner over an occupancy bitmap rasterized once from the obstacle rectangles.
+
+    Cells are flattened x-major (idx = x * max_y + y). Planner modes:
+      astar        exact A* over flat int32 g/parent arrays
+      jps          exact Jump Point Search for 4-connected grids (same lengths as astar)
+      hierarchical exact route over the obstacle-corner graph (see route_distances), expanded
+                   into staircase legs; no grid search, so cost doesn't grow with route length.
+                   The first plan builds the corner table: O(K³) time, O(K²) memory for K
+                   corners, a few ms for K <= CORNER_TABLE_MAX (~64 obstacles). With more
+                   corners it plans with jps
+    """
+
+    def __init__(self, max_x: int, max_y: int, obstacles: List[Tuple[int,int,int,int]] | None = None,
+                 planner: str = "astar", base: Tuple[int,int] = (0, 0),
+                 battery_per_cell: float = 0.01):
+        self.state = DroneState(x=base[0], y=base[1])
+        self.base = tuple(base)
+        self.battery_per_cell = battery_per_cell
         self.max_x = max_x
         self.max_y = max_y
         self.obstacles = obstacles or []
+        self.planner = planner
+        self.occupancy = np.zeros((max_x, max_y), dtype=bool)
+        for x1,y1,x2,y2 in self.obstacles:
+            self.occupancy[max(0, x1):max(0, x2+1), max(0, y1):max(0, y2+1)] = True
+        self._blocked = bytearray(self.occupancy.tobytes())
+        self._search = None  # lazily allocated flat arrays, reused across searches
+        self._jps = None
+        self._sat = None
+        self._corner_dist = None
+        self.nodes_expanded = 0
+
+    def fork(self) -> "DroneSimulator":
+        """Another drone on the same grid: shares the read-only occupancy tables, owns its state
+        and search buffers (so forks can plan concurrently from different threads)."""
+        self._corners()  # build the lazy shared tables once, before copying
+        if self.planner == "jps":
+            self._jps_tables()
+        other = copy.copy(self)
+        other.state = DroneState(x=self.base[0], y=self.base[1])
+        other._search = None
+        other.nodes_expanded = 0
+        return other
 
     def is_blocked(self, x:int, y:int) -> bool:
+        if 0 <= x < self.max_x and 0 <= y < self.max_y:
+            return bool(self._blocked[x*self.max_y + y])
         for x1,y1,x2,y2 in self.obstacles:
             if x1 <= x <= x2 and y1 <= y <= y2:
                 return True
@@ -36,33 +96,413 @@ class DroneSimulator:
     def neighbors(self, x:int, y:int):
         for dx,dy in [(1,0),(-1,0),(0,1),(0,-1)]:
             nx, ny = x+dx, y+dy
-            if 0 <= nx < self.max_x and 0 <= ny < self.max_y and not self.is_blocked(nx, ny):
+            if 0 <= nx < self.max_x and 0 <= ny < self.max_y and not self._blocked[nx*self.max_y + ny]:
                 yield nx, ny
 
-    def plan_path(self, start:Tuple[int,int], goal:Tuple[int,int]) -> Optional[List[Tuple[int,int]]]:
+    def plan_path(self, start:Tuple[int,int], goal:Tuple[int,int], mode: str | None = None) -> Optional[List[Tuple[int,int]]]:
+        mode = mode or self.planner
+        search = {"astar": self._astar, "jps": self._jps_search, "hierarchical": self._hierarchical}.get(mode)
+        if search is None:
+            raise ValueError(f"Unknown planner mode: {mode}")
+        with perf.timer("drone.plan_path"):
+            path = search(start, goal)
+        perf.observe("drone.nodes_expanded", self.nodes_expanded, unit="nodes")
+        return path
+
+    def _buffers(self):
+        # stamp[i] == 2*search id marks g/parent as valid for the current search, 2*id + 1 marks
+        # the cell closed, so nothing has to be cleared between searches. np.zeros pages are only
+        # committed once touched; memoryviews keep per-cell access as cheap as a list.
+        if self._search is None:
+            n = self.max_x * self.max_y
+            self._search = [0] + [memoryview(np.zeros(n, dtype=np.int32)) for _ in range(3)]
+        self._search[0] += 2
+        return self._search
+
+    def _astar(self, start, goal, bounds=None):
         sx, sy = start
         gx, gy = goal
-        open_set = [(0, sx, sy)]
-        came = {}
-        gscore = {(sx, sy): 0}
-        def h(a,b): return abs(a[0]-b[0]) + abs(a[1]-b[1])
-        closed = set()
-        while open_set:
-            _, x, y = heapq.heappop(open_set)
-            if (x,y) == (gx,gy):
-                path = [(x,y)]
-                while (x,y) in came:
-                    x,y = came[(x,y)]
-                    path.append((x,y))
+        H = self.max_y
+        x0, y0, x1, y1 = bounds or (0, 0, self.max_x, self.max_y)
+        if not (x0 <= gx < x1 and y0 <= gy < y1) or (start != goal and self._blocked[gx*H + gy]):
+            self.nodes_expanded = 0
+            return None if start != goal else [start]
+        cur, stamp, g, parent = self._buffers()
+        blocked = self._blocked
+        s, goal_i = sx*H + sy, gx*H + gy
+        N = self.max_x * H
+        M = N + 1
+        stamp[s] = cur; g[s] = 0; parent[s] = -1
+        # single-int heap key: f, then larger g first (deeper nodes break f-ties), then index
+        heap = [((abs(sx-gx) + abs(sy-gy)) * M + N) * N + s]
+        push, pop = heapq.heappush, heapq.heappop
+        expanded = 0
+        while heap:
+            i = pop(heap) % N
+            if i == goal_i:
+                self.nodes_expanded = expanded
+                path = []
+                while i != -1:
+                    path.append(divmod(i, H))
+                    i = parent[i]
                 return path[::-1]
-            if (x,y) in closed: 
+            if stamp[i] != cur:
                 continue
-            closed.add((x,y))
-            for nx, ny in self.neighbors(x,y):
-                tentative = gscore[(x,y)] + 1
-                if (nx,ny) not in gscore or tentative < gscore[(nx,ny)]:
-                    came[(nx,ny)] = (x,y)
-                    gscore[(nx,ny)] = tentative
-                    f = tentative + h((nx,ny),(gx,gy))
-                    heapq.heappush(open_set, (f, nx, ny))
+            stamp[i] = cur + 1
+            expanded += 1
+            x, y = divmod(i, H)
+            gn = g[i] + 1
+            for j, ok, h in ((i+H, x+1 < x1, abs(x+1-gx) + abs(y-gy)), (i-H, x > x0, abs(x-1-gx) + abs(y-gy)),
+                             (i+1, y+1 < y1, abs(x-gx) + abs(y+1-gy)), (i-1, y > y0, abs(x-gx) + abs(y-1-gy))):
+                if ok and not blocked[j] and (stamp[j] < cur or (stamp[j] == cur and gn < g[j])):
+                    stamp[j] = cur; g[j] = gn; parent[j] = i
+                    push(heap, ((gn + h) * M + N - gn) * N + j)
+        self.nodes_expanded = expanded
         return None
+
+    # --- Jump Point Search (4-connected) -------------------------------------------
+
+    def _jps_tables(self):
+        # per row: sorted blocked xs and "forced" xs for horizontal moves in +x / -x
+        if self._jps is None:
+            X, Y = self.max_x, self.max_y
+            P = np.zeros((X + 2, Y + 2), dtype=bool)
+            P[1:-1, 1:-1] = ~self.occupancy
+            up, down = P[1:-1, :-2], P[1:-1, 2:]
+            fpos = (up & ~P[:-2, :-2]) | (down & ~P[:-2, 2:])
+            fneg = (up & ~P[2:, :-2]) | (down & ~P[2:, 2:])
+            def rows(mask):
+                ys, xs = np.nonzero(mask.T)
+                cuts = np.searchsorted(ys, np.arange(Y + 1))
+                return [xs[cuts[y]:cuts[y+1]].tolist() for y in range(Y)]
+            self._jps = (rows(self.occupancy), rows(fpos & ~self.occupancy), rows(fneg & ~self.occupancy))
+        return self._jps
+
+    def _hjump(self, x, y, dx, goal):
+        # first jump point scanning row y from x (inclusive) in direction dx, or None at a wall
+        if not 0 <= y < self.max_y:
+            return None
+        walls, fpos, fneg = self._jps
+        row = walls[y]
+        if dx > 0:
+            k = bisect_left(row, x); wall = row[k] if k < len(row) else self.max_x
+            forced = fpos[y]; k = bisect_left(forced, x); cand = forced[k] if k < len(forced) else self.max_x
+            if y == goal[1] and x <= goal[0] < cand:
+                cand = goal[0]
+            return cand if cand < wall else None
+        k = bisect_right(row, x) - 1; wall = row[k] if k >= 0 else -1
+        forced = fneg[y]; k = bisect_right(forced, x) - 1; cand = forced[k] if k >= 0 else -1
+        if y == goal[1] and cand < goal[0] <= x:
+            cand = goal[0]
+        return cand if cand > wall else None
+
+    def _vjump(self, x, y, dy, goal):
+        H, X, blocked = self.max_y, self.max_x, self._blocked
+        def free(cx, cy):
+            return 0 <= cx < X and 0 <= cy < H and not blocked[cx*H + cy]
+        while 0 <= y < H and not blocked[x*H + y]:
+            if (x, y) == goal:
+                return y
+            if (free(x-1, y) and not free(x-1, y-dy)) or (free(x+1, y) and not free(x+1, y-dy)):
+                return y
+            if self._hjump(x+1, y, 1, goal) is not None or self._hjump(x-1, y, -1, goal) is not None:
+                return y
+            y += dy
+        return None
+
+    def _jps_search(self, start, goal):
+        sx, sy = start
+        gx, gy = goal
+        H = self.max_y
+        if start == goal:
+            self.nodes_expanded = 0
+            return [start]
+        if not (0 <= gx < self.max_x and 0 <= gy < H) or self._blocked[gx*H + gy]:
+            self.nodes_expanded = 0
+            return None
+        self._jps_tables()
+        cur, stamp, g, parent = self._buffers()
+        N = self.max_x * H
+        M = N + 1
+        s = sx*H + sy
+        stamp[s] = cur; g[s] = 0; parent[s] = -1
+        heap = [((abs(sx-gx) + abs(sy-gy)) * M + N) * N + s]
+        expanded = 0
+        while heap:
+            i = heapq.heappop(heap) % N
+            if stamp[i] != cur:
+                continue
+            stamp[i] = cur + 1
+            x, y = divmod(i, H)
+            if (x, y) == goal:
+                self.nodes_expanded = expanded
+                return self._unpack_jumps(i, parent, H)
+            expanded += 1
+            p = parent[i]
+            if p == -1:
+                dirs = ((1, 0), (-1, 0), (0, 1), (0, -1))
+            else:
+                px, py = divmod(p, H)
+                dx, dy = (x > px) - (x < px), (y > py) - (y < py)
+                dirs = ((0, -1), (0, 1), (dx, 0)) if dx else ((-1, 0), (1, 0), (0, dy))
+            for dx, dy in dirs:
+                if dx:
+                    jx = self._hjump(x + dx, y, dx, goal); jy = y
+                else:
+                    jy = self._vjump(x, y + dy, dy, goal); jx = x
+                if jx is None or jy is None:
+                    continue
+                j = jx*H + jy
+                gn = g[i] + abs(jx - x) + abs(jy - y)
+                if stamp[j] < cur or (stamp[j] == cur and gn < g[j]):
+                    stamp[j] = cur; g[j] = gn; parent[j] = i
+                    heapq.heappush(heap, ((gn + abs(jx-gx) + abs(jy-gy)) * M + N - gn) * N + j)
+        self.nodes_expanded = expanded
+        return None
+
+    @staticmethod
+    def _unpack_jumps(i, parent, H):
+        # jump points are joined by straight segments; expand them back into unit steps
+        points = []
+        while i != -1:
+            points.append(divmod(i, H))
+            i = parent[i]
+        points.reverse()
+        path = [points[0]]
+        for (ax, ay), (bx, by) in zip(points, points[1:]):
+            dx, dy = (bx > ax) - (bx < ax), (by > ay) - (by < ay)
+            for k in range(1, abs(bx - ax) + abs(by - ay) + 1):
+                path.append((ax + dx*k, ay + dy*k))
+        return path
+
+    # --- hierarchical: corner graph on top, staircase legs below ---------------------
+
+    @staticmethod
+    def _staircase(a, b):
+        # monotone route, x first; only valid when the a-b bounding box is obstacle-free
+        (ax, ay), (bx, by) = a, b
+        sx = 1 if bx >= ax else -1
+        sy = 1 if by >= ay else -1
+        return [(x, ay) for x in range(ax, bx + sx, sx)] + [(bx, y) for y in range(ay + sy, by + sy, sy)]
+
+    def _hierarchical(self, start, goal):
+        # shortest routes bend only at obstacle corners: pick the corner chain with the smallest
+        # exact length, then every hop (start, corners, goal) has a free bounding box
+        sx, sy = start
+        gx, gy = goal
+        if start == goal:
+            self.nodes_expanded = 0
+            return [start]
+        if not (0 <= gx < self.max_x and 0 <= gy < self.max_y) or self._blocked[gx*self.max_y + gy]:
+            self.nodes_expanded = 0
+            return None
+        if self._bbox_free(sx, sy, gx, gy):
+            self.nodes_expanded = 0
+            return self._staircase(start, goal)
+        C, D, E = self._corners()
+        if D is None or not len(C):
+            return self._jps_search(start, goal)  # too many corners to tabulate, or none to bend around
+        ds = self._direct(np.array([start]), C)[0]
+        dg = self._direct(C, np.array([goal]))[:, 0]
+        total = ds[:, None] + D + dg[None, :]
+        i, j = divmod(int(total.argmin()), len(C))
+        if not np.isfinite(total[i, j]):
+            self.nodes_expanded = len(C)
+            return None
+        chain = [i]
+        while i != j:  # next corner: one free hop from i that stays on a shortest route to j
+            on_route = E[i] + D[:, j] == D[i, j]
+            on_route[i] = False
+            i = int(np.flatnonzero(on_route)[0])
+            chain.append(i)
+        self.nodes_expanded = len(chain)
+        hops = [start] + [(int(C[k, 0]), int(C[k, 1])) for k in chain] + [goal]
+        path = [start]
+        for a, b in zip(hops, hops[1:]):
+            path.extend(self._staircase(a, b)[1:])
+        return path
+
+    # --- missions: exact pairwise route lengths, tour ordering, battery-limited sorties ----
+
+    def _block_sat(self):
+        # summed-area table over the grid compressed at obstacle edges: each block of cells is
+        # either fully blocked or free, so it costs O(obstacles²) instead of O(cells)
+        if self._sat is None:
+            edges = []
+            for n, size in ((0, self.max_x), (1, self.max_y)):
+                cuts = {0}
+                for r in self.obstacles:
+                    cuts.update(min(max(v, 0), size) for v in (r[n], r[n + 2] + 1))
+                edges.append(np.array(sorted(cuts - {size}), dtype=np.int64))
+            xe, ye = edges
+            blocked = np.zeros((len(xe), len(ye)), dtype=np.int32)
+            for x1, y1, x2, y2 in self.obstacles:
+                if x2 >= 0 and y2 >= 0 and x1 < self.max_x and y1 < self.max_y:
+                    bx = np.searchsorted(xe, [max(x1, 0), min(x2, self.max_x - 1)], side="right") - 1
+                    by = np.searchsorted(ye, [max(y1, 0), min(y2, self.max_y - 1)], side="right") - 1
+                    blocked[bx[0]:bx[1] + 1, by[0]:by[1] + 1] = 1
+            sat = np.zeros((len(xe) + 1, len(ye) + 1), dtype=np.int32)
+            np.cumsum(np.cumsum(blocked, axis=0), axis=1, out=sat[1:, 1:])
+            self._sat = (xe, ye, sat)
+        return self._sat
+
+    def _bbox_free(self, ax, ay, bx, by) -> np.ndarray:
+        # obstacle-free bounding box <=> a monotone (Manhattan-length) route exists
+        xe, ye, sat = self._block_sat()
+        ia, ib = np.searchsorted(xe, ax, side="right") - 1, np.searchsorted(xe, bx, side="right") - 1
+        ja, jb = np.searchsorted(ye, ay, side="right") - 1, np.searchsorted(ye, by, side="right") - 1
+        x0, x1 = np.minimum(ia, ib), np.maximum(ia, ib) + 1
+        y0, y1 = np.minimum(ja, jb), np.maximum(ja, jb) + 1
+        return (sat[x1, y1] - sat[x0, y1] - sat[x1, y0] + sat[x0, y0]) == 0
+
+    def _direct(self, A: np.ndarray, B: np.ndarray) -> np.ndarray:
+        ax, ay = A[:, 0, None], A[:, 1, None]
+        bx, by = B[None, :, 0], B[None, :, 1]
+        d = (np.abs(ax - bx) + np.abs(ay - by)).astype(np.float64)
+        d[~self._bbox_free(ax, ay, bx, by)] = np.inf
+        return d
+
+    @staticmethod
+    def _min_plus(X: np.ndarray, Y: np.ndarray) -> np.ndarray:
+        out = np.full((X.shape[0], Y.shape[1]), np.inf)
+        for k in range(X.shape[1]):
+            np.minimum(out, X[:, k, None] + Y[None, k, :], out=out)
+        return out
+
+    def _corners(self):
+        # free cells diagonally outside each obstacle corner, with all-pairs route lengths between
+        # them (D) and the single-hop lengths they were built from (E, used to trace routes);
+        # D and E are None above CORNER_TABLE_MAX corners
+        if self._corner_dist is None:
+            pts = set()
+            for x1, y1, x2, y2 in self.obstacles:
+                for cx in (x1 - 1, x2 + 1):
+                    for cy in (y1 - 1, y2 + 1):
+                        if 0 <= cx < self.max_x and 0 <= cy < self.max_y and not self._blocked[cx*self.max_y + cy]:
+                            pts.add((cx, cy))
+            C = np.array(sorted(pts), dtype=np.int64).reshape(-1, 2)
+            self._block_sat()
+            D = E = None
+            if len(C) <= CORNER_TABLE_MAX:
+                D = self._corner_table(C)
+                E = self._direct(C, C)  # single hops (free bounding box); shortest routes are chains of these
+            self._corner_dist = (C, D, E)
+        return self._corner_dist
+
+    def _corner_table(self, C: np.ndarray) -> np.ndarray:
+        D = self._direct(C, C)
+        for k in range(len(C)):  # Floyd-Warshall over the corner graph
+            np.minimum(D, D[:, k, None] + D[None, k, :], out=D)
+        return D
+
+    def route_distances(self, points) -> np.ndarray:
+        """Shortest 4-connected route lengths between all pairs of ``points`` (inf if unreachable).
+
+        Equal to ``len(plan_path(a, b)) - 1``. Pairs with an obstacle-free bounding box are
+        Manhattan apart; the rest are relaxed through obstacle corners, where shortest routes
+        around rectangles bend. For K corners this costs O(P² + P·K²) through the corner table
+        (K <= CORNER_TABLE_MAX), else a Dijkstra per point over the corner graph in O(P·K² + P²·K)
+        time and O(K² + P·K) memory, instead of P² searches. On 4096x4096 with 300 targets: ~0.1 s
+        around 60 obstacles, ~3 s around 400 (1,600 corners)."""
+        P = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+        C, Dcc, _ = self._corners()
+        D = self._direct(P, P)
+        if len(C):
+            Dpc = self._direct(P, C)
+            Dpc_via = self._min_plus(Dpc, Dcc) if Dcc is not None else self._corner_search(Dpc, C)
+            np.minimum(D, self._min_plus(Dpc_via, Dpc.T), out=D)
+        return D
+
+    def _corner_search(self, Dpc: np.ndarray, C: np.ndarray) -> np.ndarray:
+        # shortest lengths from each point to each corner: one Dijkstra per point (row), run in
+        # lockstep so every step is a few vectorized row operations. float32 is exact for
+        # lengths below 2**24 and halves the memory traffic
+        E = self._direct(C, C).astype(np.float32)
+        dist = Dpc.astype(np.float32)
+        frontier, settled = dist.copy(), np.zeros_like(dist)  # settled: inf once a corner is final
+        rows = np.arange(len(dist))
+        for _ in range(len(C)):
+            u = frontier.argmin(axis=1)
+            du = frontier[rows, u]
+            if not np.isfinite(du).any():
+                break
+            settled[rows, u] = np.inf
+            np.minimum(dist, du[:, None] + E[u], out=dist)
+            np.add(dist, settled, out=frontier)
+        return dist.astype(np.float64)
+
+    @staticmethod
+    def _two_opt(order: List[int], D: np.ndarray, max_passes: int = 50) -> List[int]:
+        # open tour with a fixed first stop; reversing order[i..j] swaps edges (i-1,i), (j,j+1)
+        p = np.array(order)
+        n = len(p)
+        for _ in range(max_passes):
+            improved = False
+            for i in range(1, n - 1):
+                j = np.arange(i + 1, n)
+                nxt = np.append(p[j[:-1] + 1], p[0])  # no edge after the last stop
+                tail = np.where(j < n - 1, 1.0, 0.0)
+                delta = (D[p[i-1], p[j]] + tail * (D[p[i], nxt] - D[p[j], nxt])) - D[p[i-1], p[i]]
+                k = int(np.argmin(delta))
+                if delta[k] < -1e-9:
+                    p[i:j[k]+1] = p[i:j[k]+1][::-1].copy()
+                    improved = True
+            if not improved:
+                break
+        return p.tolist()
+
+    def plan_mission(self, targets: List[Tuple[int,int]]) -> Mission:
+        """Visit order for ``targets`` starting from the current state.
+
+        Nearest-neighbour tour improved by 2-opt, then cut into sorties so the battery never
+        drops below what is needed to get back to base (recharged to 100% there)."""
+        targets = [tuple(map(int, t)) for t in targets]
+        start = (self.state.x, self.state.y)
+        D = self.route_distances([start, self.base] + targets)
+        full = 100.0 / self.battery_per_cell  # cells on a full battery
+        td = np.arange(len(targets)) + 2
+        ok = np.isfinite(D[0, td]) & (2 * D[1, td] <= full)
+        skipped = [int(i) for i in np.flatnonzero(~ok)]
+        todo = [int(i) for i in td[ok]]
+        order, cur = [0], 0
+        remaining = set(todo)
+        while remaining:
+            cur = min(remaining, key=lambda j: (D[cur, j], j))
+            order.append(cur); remaining.discard(cur)
+        order = self._two_opt(order, D)[1:]
+        sorties, sortie, distance = [], [], 0.0
+        pos, cells = 0, self.state.battery_pct / self.battery_per_cell
+        for j in order:
+            if cells < D[pos, j] + D[j, 1]:  # back to base first (an empty first sortie: straight there)
+                distance += D[pos, 1]
+                sorties.append(sortie)
+                sortie, pos, cells = [], 1, full
+            distance += D[pos, j]; cells -= D[pos, j]
+            sortie.append(j - 2); pos = j
+        if sortie:
+            sorties.append(sortie)
+        return Mission(targets=targets, sorties=sorties, skipped=skipped, distance=int(distance))
+
+    def fly(self, path: List[Tuple[int,int]]):
+        if path:
+            self.state.x, self.state.y = path[-1]
+            self.state.battery_pct = max(0.0, self.state.battery_pct - (len(path) - 1) * self.battery_per_cell)
+
+    def execute_mission(self, mission: Mission, api: DroneAPI, geo, on_arrive=None) -> int:
+        """Fly ``mission`` through ``api``; ``geo(x, y)`` gives lat/lon, ``on_arrive(i)`` runs at target i.
+
+        Returns the number of cells flown."""
+        flown = 0
+        for n, sortie in enumerate(mission.sorties):
+            stops = ([self.base] if n else []) + [mission.targets[i] for i in sortie]
+            for k, goal in enumerate(stops):
+                path = self.plan_path((self.state.x, self.state.y), goal)
+                if path is None:
+                    raise RuntimeError(f"No route to {goal[0]}x{goal[1]}")
+                self.fly(path); flown += len(path) - 1
+                api.go_to(goal[0], goal[1], *geo(*goal))
+                if n and k == 0:
+                    self.state.battery_pct = 100.0  # recharge at base
+                elif on_arrive is not None:
+                    on_arrive(sortie[k - 1 if n else k])
+        return flown
@@ -1,6 +1,7 @@
 \
 import math
 from dataclasses import dataclass
+import numpy as np
 
 @dataclass
 class FieldConfig:
@@ -16,6 +17,8 @@ class FieldGrid:
 
     def __init__(self, cfg: FieldConfig):
         self.cfg = cfg
+        theta = math.radians(cfg.orientation_deg)
+        self._cos, self._sin = math.cos(theta), math.sin(theta)
 
     def in_bounds(self, x: int, y: int) -> bool:
         return 0 <= x < self.cfg.max_x and 0 <= y < self.cfg.max_y
@@ -23,10 +26,39 @@ class FieldGrid:
     def cell_center_geo(self, x: int, y: int) -> tuple[float, float]:
         dx_feet = (x + 0.5) * self.cfg.feet_per_cell
         dy_feet = (y + 0.5) * self.cfg.feet_per_cell
-        theta = math.radians(self.cfg.orientation_deg)
-        east_feet = dx_feet*math.cos(theta) - dy_feet*math.sin(theta)
-        north_feet = dx_feet*math.sin(theta) + dy_feet*math.cos(theta)
+        east_feet = dx_feet*self._cos - dy_feet*self._sin
+        north_feet = dx_feet*self._sin + dy_feet*self._cos
         lat = self.cfg.origin_lat + (north_feet / self.FEET_PER_DEG_LAT)
         feet_per_deg_lon = math.cos(math.radians(lat)) * self.FEET_PER_DEG_LAT
         lon = self.cfg.origin_lon + (east_feet / feet_per_deg_lon) if feet_per_deg_lon != 0 else self.cfg.origin_lon
         return lat, lon
+
+    def cells_to_geo(self, xs, ys):
+        """Vectorized cell_center_geo: lat/lon arrays for broadcastable ``xs``/``ys``."""
+        dx_feet = (np.asarray(xs, dtype=np.float64) + 0.5) * self.cfg.feet_per_cell
+        dy_feet = (np.asarray(ys, dtype=np.float64) + 0.5) * self.cfg.feet_per_cell
+        east_feet = dx_feet*self._cos - dy_feet*self._sin
+        north_feet = dx_feet*self._sin + dy_feet*self._cos
+        lat = self.cfg.origin_lat + (north_feet / self.FEET_PER_DEG_LAT)
+        feet_per_deg_lon = np.cos(np.radians(lat)) * self.FEET_PER_DEG_LAT
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lon = np.where(feet_per_deg_lon != 0, self.cfg.origin_lon + east_feet / feet_per_deg_lon, self.cfg.origin_lon)
+        return lat, lon
+
+    def geo_to_cell(self, lat, lon):
+        """Inverse of cell_center_geo: the cell containing each GPS point.
+
+        Returns ``(xs, ys, inside)``; scalars in give ints and a bool back. Points outside
+        the field keep their (out-of-range) cell indices with ``inside`` False."""
+        scalar = np.ndim(lat) == 0 and np.ndim(lon) == 0
+        lat = np.asarray(lat, dtype=np.float64); lon = np.asarray(lon, dtype=np.float64)
+        north_feet = (lat - self.cfg.origin_lat) * self.FEET_PER_DEG_LAT
+        east_feet = (lon - self.cfg.origin_lon) * (np.cos(np.radians(lat)) * self.FEET_PER_DEG_LAT)
+        dx_feet = east_feet*self._cos + north_feet*self._sin
+        dy_feet = north_feet*self._cos - east_feet*self._sin
+        xs = np.floor(dx_feet / self.cfg.feet_per_cell).astype(np.int64)
+        ys = np.floor(dy_feet / self.cfg.feet_per_cell).astype(np.int64)
+        inside = (xs >= 0) & (xs < self.cfg.max_x) & (ys >= 0) & (ys < self.cfg.max_y)
+        if scalar:
+            return int(xs), int(ys), bool(inside)
+        return xs, ys, inside
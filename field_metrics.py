@@ -0,0 +1,197 @@
+from __future__ import annotations
+import os, math, threading, multiprocessing
+from dataclasses import dataclass, field as dc_field
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from field import FieldConfig
+from utils import CARE_LABELS, deterministic_features_for_bbox
+
+N_CARE = len(CARE_LABELS)
+
+@dataclass
+class FieldTotals:
+    cells: int = 0
+    harvestable: int = 0
+    yield_sum: float = 0.0
+    care_hist: np.ndarray = dc_field(default_factory=lambda: np.zeros(N_CARE, dtype=np.int64))
+
+    def add(self, preds: dict):
+        self.cells += len(preds["harvestable"])
+        self.harvestable += int(preds["harvestable"].sum())
+        self.yield_sum += float(preds["yield_sqft"].sum())
+        self.care_hist += np.bincount(preds["care_label"], minlength=N_CARE)[:N_CARE]
+        return self
+
+    def merge(self, other: "FieldTotals"):
+        self.cells += other.cells
+        self.harvestable += other.harvestable
+        self.yield_sum += other.yield_sum
+        self.care_hist += other.care_hist
+        return self
+
+    @property
+    def avg_yield(self) -> float:
+        return self.yield_sum / self.cells if self.cells else 0.0
+
+@dataclass
+class FieldEstimate:
+    samples: int
+    total_cells: int
+    harvestable_cells: float
+    harvestable_ci: float
+    avg_yield: float
+    avg_yield_ci: float
+    care_share: np.ndarray
+
+    @property
+    def total_harvest_potential(self) -> float:
+        return self.avg_yield * self.total_cells
+
+# --- exact mode: row bands on a process pool -------------------------------------------
+
+_WORKER_AI = None
+
+def _init_worker(model_path: str, random_state: int, n_train: int):
+    global _WORKER_AI
+    from ai_models import AFDSAI
+    _WORKER_AI = AFDSAI.load(model_path, random_state=random_state, n_train=n_train)
+
+def _bbox_totals(x0: int, y0: int, x1: int, y1: int, rows_per_chunk: int, ai=None) -> FieldTotals:
+    ai = ai or _WORKER_AI
+    totals = FieldTotals()
+    for y in range(y0, y1, rows_per_chunk):
+        feats = deterministic_features_for_bbox(x0, y, x1, min(y1, y + rows_per_chunk)).reshape(-1, 7)
+        totals.add(ai.predict_batch(feats, chunk_size=8192, n_jobs=1))
+    return totals
+
+def _run_boxes(ai, boxes, workers: int | None, rows_per_chunk: int):
+    # FieldTotals per (x0, y0, x1, y1) box, in input order
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(boxes) == 1:
+        return [_bbox_totals(*box, rows_per_chunk, ai=ai) for box in boxes]
+    if ai.path is None:
+        ai.export()
+    # not fork: callers run on batch lanes while other threads (DB writer, raster, perf) may hold
+    # locks a forked child would inherit held; workers load the model from the artifact anyway
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method),
+                             initializer=_init_worker, initargs=(ai.path, ai.random_state, ai.n_train)) as pool:
+        futures = [pool.submit(_bbox_totals, *box, rows_per_chunk) for box in boxes]
+        return [fut.result() for fut in futures]
+
+def exact_field_metrics(cfg: FieldConfig, ai, workers: int | None = None, band_rows: int = 64,
+                        rows_per_chunk: int = 8) -> FieldTotals:
+    # every cell of the field; bands are reduced in order so results don't depend on scheduling
+    bands = [(0, y, cfg.max_x, min(cfg.max_y, y + band_rows)) for y in range(0, cfg.max_y, band_rows)]
+    totals = FieldTotals()
+    for band in _run_boxes(ai, bands, workers, rows_per_chunk):
+        totals.merge(band)
+    return totals
+
+def exact_tile_metrics(ai, bounds: dict, workers: int | None = None, chunk_cells: int = 32768) -> dict:
+    # bounds: {(tx, ty): (x0, y0, x1, y1)} -> {(tx, ty): FieldTotals}
+    if not bounds:
+        return {}
+    keys = list(bounds)
+    width = max(x1 - x0 for x0, _, x1, _ in bounds.values())
+    totals = _run_boxes(ai, [bounds[k] for k in keys], workers, max(1, chunk_cells // width))
+    return dict(zip(keys, totals))
+
+# --- sampled mode: uniform random cells with normal-approximation intervals -----------
+
+def sampled_field_metrics(cfg: FieldConfig, lookup, n: int = 16384, seed: int = 0, z: float = 1.96,
+                          boxes=None) -> FieldEstimate:
+    # lookup(xs, ys) -> (feats, preds), e.g. FieldRaster.lookup. boxes: optional list of
+    # disjoint (x0, y0, x1, y1) to sample from instead of the whole field
+    if boxes is None:
+        boxes = [(0, 0, cfg.max_x, cfg.max_y)]
+    b = np.array(boxes, dtype=np.int64).reshape(-1, 4)
+    widths = b[:, 2] - b[:, 0]
+    ends = np.cumsum(widths * (b[:, 3] - b[:, 1]))
+    total = int(ends[-1]) if len(ends) else 0
+    n = min(n, total)
+    rng = np.random.default_rng(seed)
+    idx = rng.choice(total, size=n, replace=False) if n < total else np.arange(total)
+    k = np.searchsorted(ends, idx, side="right")
+    starts = ends - widths * (b[:, 3] - b[:, 1])
+    ly, lx = np.divmod(idx - starts[k], widths[k])
+    xs, ys = b[k, 0] + lx, b[k, 1] + ly
+    _, preds = lookup(xs, ys)
+    h = preds["harvestable"].astype(float); y = preds["yield_sqft"]
+    fpc = math.sqrt((total - n) / (total - 1)) if total > 1 else 0.0  # sampling without replacement
+    def ci(v):
+        return z * float(v.std(ddof=1)) / math.sqrt(n) * fpc if n > 1 else float("inf")
+    return FieldEstimate(samples=n, total_cells=total,
+                         harvestable_cells=float(h.mean()) * total, harvestable_ci=ci(h) * total,
+                         avg_yield=float(y.mean()), avg_yield_ci=ci(y),
+                         care_share=np.bincount(preds["care_label"], minlength=N_CARE)[:N_CARE] / n)
+
+# --- incremental mode: running per-tile totals -----------------------------------------
+
+class TileMetrics:
+    """Running FieldTotals per raster tile, persisted in the DB under the raster key.
+
+    A tile is tracked once it has been evaluated (a raster fill or an exact backfill), so the
+    field totals are a sum over tiles and cost O(tiles) to read."""
+
+    def __init__(self, db, raster):
+        self.db = db
+        self.raster = raster
+        self.source = raster.key
+        self._lock = threading.Lock()
+        self.tiles = {}   # (tx, ty) -> FieldTotals
+        db.purge_metrics_state(self.source)
+        for r in db.tile_metrics(self.source):
+            self.tiles[(r["tile_x"], r["tile_y"])] = FieldTotals(
+                r["cells"], r["harvestable"], r["yield_sum"], np.array(r["care_hist"], dtype=np.int64))
+
+    @property
+    def n_tiles(self) -> int:
+        return self.raster.tiles_x * self.raster.tiles_y
+
+    @property
+    def all_tiles(self):
+        return [(tx, ty) for ty in range(self.raster.tiles_y) for tx in range(self.raster.tiles_x)]
+
+    def untracked(self) -> list:
+        return [t for t in self.all_tiles if t not in self.tiles]
+
+    def _persist(self, keys):
+        self.db.write_tile_metrics(self.source, [(tx, ty, t.cells, t.harvestable, t.yield_sum, t.care_hist)
+                                                 for (tx, ty), t in ((k, self.tiles[k]) for k in keys)])
+
+    def set_tile(self, tx: int, ty: int, preds: dict):
+        """A whole tile was (re)evaluated, e.g. FieldRaster.on_fill."""
+        self.set_tiles({(tx, ty): FieldTotals().add({k: np.asarray(preds[k]).reshape(-1) for k in
+                                                     ("harvestable", "yield_sqft", "care_label")})})
+
+    def adopt(self, tx: int, ty: int, preds: dict):
+        """Like set_tile for a tile evaluated earlier (e.g. a raster file from before tracking); no-op if tracked."""
+        if (tx, ty) not in self.tiles:
+            self.set_tiles({(tx, ty): FieldTotals().add({k: np.asarray(preds[k]).reshape(-1) for k in
+                                                         ("harvestable", "yield_sqft", "care_label")})}, replace=False)
+
+    def set_tiles(self, totals: dict, replace: bool = True):
+        with self._lock:
+            if not replace:
+                totals = {k: v for k, v in totals.items() if k not in self.tiles}
+            self.tiles.update(totals)
+            self._persist(list(totals))
+
+    def backfill(self, ai, workers: int | None = None) -> int:
+        """Evaluate every untracked tile exactly (without filling the raster)."""
+        missing = {t: self.raster.tile_bounds(*t) for t in self.untracked()}
+        self.set_tiles(exact_tile_metrics(ai, missing, workers=workers), replace=False)
+        return len(missing)
+
+    def totals(self) -> FieldTotals:
+        return self.coverage()[0]
+
+    def coverage(self):
+        """(totals over tracked tiles, untracked tiles) from one consistent view."""
+        with self._lock:
+            out = FieldTotals()
+            for t in self.tiles.values():
+                out.merge(t)
+            return out, [t for t in self.all_tiles if t not in self.tiles]
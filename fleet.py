@@ -0,0 +1,209 @@
+from __future__ import annotations
+import abc, asyncio, heapq, itertools
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field as dc_field
+from typing import List, Tuple
+
+from drone import DroneSimulator
+
+@dataclass
+class FleetAction:
+    kind: str                # "soil" or "drop"
+    x: int
+    y: int
+    kg: float = 0.0
+    seed_type: str = ""
+
+@dataclass
+class FleetResult:
+    action: FleetAction
+    drone: str
+    start_s: float           # simulated seconds
+    end_s: float
+    cells: int               # flown, including any detour to base
+    ok: bool = True
+
+@dataclass
+class FleetReport:
+    results: List[FleetResult] = dc_field(default_factory=list)
+    makespan_s: float = 0.0
+    wall_s: float = 0.0
+
+    @property
+    def completed(self) -> int:
+        return sum(r.ok for r in self.results)
+
+    @property
+    def actions_per_hour(self) -> float:
+        return self.completed / (self.makespan_s / 3600) if self.makespan_s else 0.0
+
+class SimClock:
+    """Virtual clock for the simulated fleet.
+
+    Time jumps to the next wake-up as soon as every participant that holds the clock is
+    asleep on it, so an hour of flying costs no wall time and results don't depend on
+    how long planning takes in the worker pool."""
+
+    def __init__(self):
+        self.now = 0.0
+        self._timers = []
+        self._seq = itertools.count()
+        self._held = 0
+        self._sleeping = 0
+
+    def hold(self):
+        self._held += 1
+
+    def release(self):
+        self._held -= 1
+        self._advance()
+
+    async def sleep(self, seconds: float):
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._timers, (self.now + max(0.0, seconds), next(self._seq), fut))
+        self._sleeping += 1
+        self._advance()
+        await fut
+
+    def _advance(self):
+        if self._timers and self._sleeping >= self._held:
+            t, _, fut = heapq.heappop(self._timers)
+            self.now = max(self.now, t)
+            self._sleeping -= 1
+            fut.set_result(None)
+
+class AsyncDroneAPI(abc.ABC):
+    @abc.abstractmethod
+    async def go_to(self, x: int, y: int, lat: float, lon: float) -> int: ...
+
+    @abc.abstractmethod
+    async def seed_drop(self, kg: float, seed_type: str): ...
+
+    @abc.abstractmethod
+    async def collect_soil_sample(self): ...
+
+class SimulatedDrone(AsyncDroneAPI):
+    """Local backend: flight time = route length / speed on a shared SimClock.
+
+    Routes are planned on a worker pool so the event loop keeps dispatching while a drone
+    plans; before each leg the drone detours to base to recharge if it could not get back."""
+
+    def __init__(self, name: str, sim: DroneSimulator, clock: SimClock, pool: ThreadPoolExecutor,
+                 speed_cells_per_s: float = 10.0, soil_sample_s: float = 60.0, seed_drop_s: float = 20.0,
+                 charge_s: float = 1800.0):
+        self.name = name
+        self.sim = sim
+        self.clock = clock
+        self.pool = pool
+        self.speed = speed_cells_per_s
+        self.soil_sample_s = soil_sample_s
+        self.seed_drop_s = seed_drop_s
+        self.charge_s = charge_s
+
+    @property
+    def position(self) -> Tuple[int, int]:
+        return (self.sim.state.x, self.sim.state.y)
+
+    async def _fly(self, goal: Tuple[int, int]) -> int:
+        loop = asyncio.get_running_loop()
+        path = await loop.run_in_executor(self.pool, self.sim.plan_path, self.position, goal)
+        if path is None:
+            raise RuntimeError(f"{self.name}: no route to {goal[0]}x{goal[1]}")
+        self.sim.fly(path)
+        await self.clock.sleep((len(path) - 1) / self.speed)
+        return len(path) - 1
+
+    async def go_to(self, x: int, y: int, lat: float = 0.0, lon: float = 0.0) -> int:
+        cells = 0
+        loop = asyncio.get_running_loop()
+        d = await loop.run_in_executor(self.pool, self.sim.route_distances, [self.position, (x, y), self.sim.base])
+        if d[0, 1] == float("inf"):
+            raise RuntimeError(f"{self.name}: no route to {x}x{y}")
+        if self.sim.state.battery_pct < (d[0, 1] + d[1, 2]) * self.sim.battery_per_cell:
+            if self.position != self.sim.base:
+                cells += await self._fly(self.sim.base)
+            await self.clock.sleep(self.charge_s * (1 - self.sim.state.battery_pct / 100.0))
+            self.sim.state.battery_pct = 100.0
+        return cells + await self._fly((x, y))
+
+    async def seed_drop(self, kg: float, seed_type: str):
+        await self.clock.sleep(self.seed_drop_s)
+
+    async def collect_soil_sample(self):
+        await self.clock.sleep(self.soil_sample_s)
+
+class Fleet:
+    """Dispatches queued actions, FIFO, each to the nearest idle drone (by route length)."""
+
+    def __init__(self, sim: DroneSimulator, n_drones: int, db=None, geo=None, workers: int | None = None, **drone_kw):
+        self.clock = SimClock()
+        self.pool = ThreadPoolExecutor(max_workers=workers or n_drones, thread_name_prefix="fleet-plan")
+        self.drones = [SimulatedDrone(f"drone-{i}", sim.fork(), self.clock, self.pool, **drone_kw)
+                       for i in range(n_drones)]
+        self.sim = sim
+        self.db = db
+        self.geo = geo
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+    async def _execute(self, drone: SimulatedDrone, action: FleetAction) -> FleetResult:
+        start = self.clock.now
+        try:
+            lat, lon = self.geo(action.x, action.y) if self.geo else (0.0, 0.0)
+            cells = await drone.go_to(action.x, action.y, lat, lon)
+            if action.kind == "soil":
+                await drone.collect_soil_sample()
+            else:
+                await drone.seed_drop(action.kg, action.seed_type)
+        except RuntimeError:
+            return FleetResult(action, drone.name, start, self.clock.now, 0, ok=False)
+        if self.db is not None:
+            if action.kind == "soil":
+                self.db.log_action("SOIL_SAMPLE", action.x, action.y, notes=f"Fleet soil sample ({drone.name})")
+            else:
+                self.db.log_action("SEED_DROP", action.x, action.y, action.kg, notes=f"{action.seed_type} ({drone.name})")
+        return FleetResult(action, drone.name, start, self.clock.now, cells)
+
+    async def _nearest(self, idle: List[SimulatedDrone], action: FleetAction) -> SimulatedDrone:
+        points = [(action.x, action.y)] + [dr.position for dr in idle]
+        d = await asyncio.get_running_loop().run_in_executor(self.pool, self.sim.route_distances, points)
+        return idle[int(d[0, 1:].argmin())]
+
+    async def _dispatch(self, queue, idle, running):
+        # holds the clock while route lengths are computed in the pool, so tasks started here
+        # can't move it before every idle drone has its work
+        self.clock.hold()
+        try:
+            while queue and idle:
+                action = queue.pop()
+                drone = await self._nearest(idle, action)
+                idle.remove(drone)
+                self.clock.hold()  # held until the scheduler has handled this task's completion
+                running[asyncio.ensure_future(self._execute(drone, action))] = drone
+        finally:
+            self.clock.release()
+
+    async def run(self, actions: List[FleetAction]) -> FleetReport:
+        loop = asyncio.get_running_loop()
+        t0, c0 = loop.time(), self.clock.now
+        queue = list(reversed(actions))
+        idle = list(self.drones)
+        running = {}
+        report = FleetReport()
+        finished = 0
+        while queue or running:
+            # hand out work at the current simulated time before letting the clock move on
+            await self._dispatch(queue, idle, running)
+            for _ in range(finished):
+                self.clock.release()
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=lambda t: running[t].name):
+                idle.append(running.pop(task))
+                report.results.append(task.result())
+            finished = len(done)
+        for _ in range(finished):
+            self.clock.release()
+        report.makespan_s = self.clock.now - c0
+        report.wall_s = loop.time() - t0
+        return report
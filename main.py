@@ -1,48 +1,109 @@
 \
-import os, json
+import os, json, time, asyncio, threading
 import numpy as np
 
 from field import FieldConfig, FieldGrid
 from ai_models import AFDSAI
-from vision import synthesize_uhd_field, simple_object_recognition
+from vision import synthesize_uhd_field, cached_object_recognition
 from drone import DroneAPI, DroneSimulator
+from fleet import Fleet, FleetAction
 from database import DB
-from utils import load_config, parse_command, deterministic_features_for_cell, CARE_LABELS, neighborhood_window, plot_3d_surface, env_snapshot
+from raster import FieldRaster, PRED_FIELDS, INT_FIELDS
+from field_metrics import TileMetrics, exact_field_metrics, sampled_field_metrics
+import perf
+from utils import load_config, parse_command, CARE_LABELS, neighborhood_window, plot_3d_surface, env_snapshot
 
 def ensure_dirs():
     os.makedirs("outputs", exist_ok=True)
     os.makedirs("data", exist_ok=True)
 
 def setup(cfg):
+    # only what the prompt needs; models, raster, drone and DB start on first use (see Context)
     ensure_dirs()
     img_path = os.path.join("data", "uhd_field.png")
     if not os.path.exists(img_path):
         print("[INIT] Generating synthetic UHD field image...")
         synthesize_uhd_field(save_path=img_path, seed=cfg["simulation"]["seed"])
-    print("[INIT] Running simple object recognition on UHD image...")
-    parasite_points = simple_object_recognition(img_path)
-    print(f"[INFO] Found approx {len(parasite_points)} parasite patches (simulated).")
-    print("[INIT] Training fast ML models (synthetic)...")
-    ai = AFDSAI(random_state=cfg["simulation"]["seed"])
-    fcfg = FieldConfig(**cfg["field"])
-    field = FieldGrid(fcfg)
-    drone = DroneSimulator(fcfg.max_x, fcfg.max_y, cfg["simulation"].get("obstacles", []))
-    api = DroneAPI()
-    db = DB(cfg["database"]["path"])
-    return field, ai, drone, api, db
-
-def matrix_value(ai: AFDSAI, x:int, y:int):
-    feats = deterministic_features_for_cell(x,y)
-    pred = ai.predict_all(feats)
+    parasite_points, patches = cached_object_recognition(img_path, mode="components")
+    print(f"[INFO] Found {len(patches)} parasite patches in {len(parasite_points)} 50-px bins (simulated).")
+
+def init_ai(ctx):
+    mcfg = ctx["cfg"].get("models", {})
+    t0 = time.perf_counter()
+    ai = AFDSAI.load_or_train(mcfg.get("dir", os.path.join("data", "models")),
+                              random_state=ctx["cfg"]["simulation"]["seed"], n_train=mcfg.get("n_train", 12000))
+    start = "warm: loaded artifact" if ai.source == "artifact" else "cold: trained and exported"
+    print(f"[INIT] ML models ready in {time.perf_counter() - t0:.2f}s ({start}).")
+    try:
+        ai.set_backend(mcfg.get("backend", "sklearn"))
+    except ValueError as e:
+        print(f"[WARN] {e}; using sklearn inference.")
+    return ai
+
+def init_field(ctx):
+    return FieldGrid(FieldConfig(**ctx["cfg"]["field"]))
+
+def init_drone(ctx):
+    fcfg, scfg = ctx["field"].cfg, ctx["cfg"]["simulation"]
+    return DroneSimulator(fcfg.max_x, fcfg.max_y, scfg.get("obstacles", []), planner=scfg.get("planner", "astar"),
+                          base=tuple(scfg.get("base", (0, 0))), battery_per_cell=scfg.get("battery_pct_per_cell", 0.01))
+
+def init_db(ctx):
+    dcfg = ctx["cfg"]["database"]
+    return DB(dcfg["path"], write_behind=dcfg.get("write_behind", False), batch_rows=dcfg.get("batch_rows", 500),
+              flush_interval=dcfg.get("flush_interval_s", 0.5), synchronous=dcfg.get("synchronous"))
+
+def init_raster(ctx):
+    rcfg = ctx["cfg"].get("raster", {})
+    raster = FieldRaster(ctx["field"], ctx["ai"], root=rcfg.get("dir", os.path.join("data", "raster")),
+                         tile=rcfg.get("tile", 256), memory_mb=rcfg.get("memory_mb", 256))
+    tiles = TileMetrics(ctx["db"], raster)
+    raster.on_fill, raster.on_load = tiles.set_tile, tiles.adopt  # hooked before any tile is touched
+    ctx["tiles"] = tiles
+    return raster
+
+def init_tiles(ctx):
+    ctx["raster"]  # registers its TileMetrics
+    return dict.__getitem__(ctx, "tiles")
+
+INITIALIZERS = {"field": init_field, "ai": init_ai, "drone": init_drone, "api": lambda ctx: DroneAPI(),
+                "db": init_db, "raster": init_raster, "tiles": init_tiles}
+
+class Context(dict):
+    """Subsystems by name, each built on first access (``ctx["ai"]``) by INITIALIZERS.
+
+    Keeps the models, raster and DB out of the way of the first prompt; ``name in ctx``
+    tells whether one has been started. Batch lanes share it: each subsystem has its own
+    lock, so a drone command doesn't wait for the models another lane is loading."""
+
+    def __init__(self, cfg: dict):
+        super().__init__(cfg=cfg, fleet=None)
+        self._locks = {name: threading.Lock() for name in INITIALIZERS}
+
+    def __missing__(self, name):
+        with self._locks[name]:
+            if not dict.__contains__(self, name):
+                self.setdefault(name, INITIALIZERS[name](self))
+            return dict.__getitem__(self, name)
+
+def matrix_value(raster: FieldRaster, x:int, y:int):
+    feats, pred = raster.cell(x, y)
     return pred["harvestable"], feats, pred
 
-def cmd_situation(field, ai, db, x:int, y:int):
+def situation_record(x, y, lat, lon, preds, env):
+    return {"x": x, "y": y, "lat": lat, "lon": lon, "harvestable": preds["harvestable"],
+            "care": CARE_LABELS[preds["care_label"]], **{k: preds[k] for k in PRED_FIELDS if k not in INT_FIELDS},
+            "env": env}
+
+@perf.timed("cmd.situation")
+def cmd_situation(field, raster, db, x:int, y:int):
     if not field.in_bounds(x,y):
         print(f"[ERROR] Spot {x}x{y} is outside the field (max {field.cfg.max_x}x{field.cfg.max_y}).")
-        return
+        return {"error": f"Spot {x}x{y} is outside the field"}
     lat, lon = field.cell_center_geo(x,y)
-    h, feats, preds = matrix_value(ai, x,y)
+    h, feats, preds = matrix_value(raster, x,y)
     db.log_observation(x,y,lat,lon,feats,preds)
+    env = env_snapshot()
     print(f"\n[ZONE {x}x{y}] GPS=({lat:.6f}, {lon:.6f})")
     print(f"  Matrix value (0/1 harvestable): {h}")
     print(f"  Care needed: {CARE_LABELS[preds['care_label']]}")
@@ -50,78 +111,227 @@ def cmd_situation(field, ai, db, x:int, y:int):
     print("  Requirements (%): "
           f"water {preds['water_req_pct']:.0f}%, nutrients {preds['nutrient_req_pct']:.0f}%, "
           f"fertilizer {preds['fertilizer_req_pct']:.0f}%, parasite {preds['parasite_pct']:.0f}%")
-    print(f"  Env snapshot: {env_snapshot()}")
+    print(f"  Env snapshot: {env}")
+    return situation_record(x, y, lat, lon, preds, env)
+
+@perf.timed("cmd.situation_batch")
+def batch_situation(field, raster, db, cells):
+    """Many situation queries at once: one raster lookup, one geo transform, one DB write."""
+    xs = np.array([c[0] for c in cells], dtype=np.int64); ys = np.array([c[1] for c in cells], dtype=np.int64)
+    inside = (xs >= 0) & (xs < field.cfg.max_x) & (ys >= 0) & (ys < field.cfg.max_y)
+    out = [{"error": f"Spot {x}x{y} is outside the field"} for x, y in cells]
+    idx = np.flatnonzero(inside)
+    if not len(idx):
+        return out
+    feats, preds = raster.lookup(xs[idx], ys[idx])
+    lats, lons = field.cells_to_geo(xs[idx], ys[idx])
+    db.log_observations(xs[idx], ys[idx], lats, lons, feats, preds)
+    cols = {k: v.tolist() for k, v in preds.items()}
+    lats, lons = lats.tolist(), lons.tolist()
+    for k, i in enumerate(idx.tolist()):
+        out[i] = situation_record(cells[i][0], cells[i][1], lats[k], lons[k], {n: cols[n][k] for n in cols}, env_snapshot())
+    return out
 
-def cmd_collect_soil(field, ai, drone, api, db, x:int, y:int):
+@perf.timed("cmd.collect_soil")
+def cmd_collect_soil(field, drone, api, db, x:int, y:int):
     if not field.in_bounds(x,y):
         print(f"[ERROR] Spot {x}x{y} is outside the field.")
-        return
+        return {"error": f"Spot {x}x{y} is outside the field"}
     lat, lon = field.cell_center_geo(x,y)
     start = (drone.state.x, drone.state.y); goal = (x,y)
     path = drone.plan_path(start, goal)
     if path is None:
         print("[WARN] No collision-free path found (simulation).")
     else:
-        print(f"[ROUTE] Steps: {len(path)}")
+        drone.fly(path)
+        print(f"[ROUTE] Steps: {len(path)} (battery {drone.state.battery_pct:.1f}%)")
     api.go_to(x,y,lat,lon)
     api.collect_soil_sample()
     db.log_action("SOIL_SAMPLE", x,y, notes="Live soil sample requested")
     print("[OK] Soil sample collected (simulated).")
+    return {"x": x, "y": y, "steps": len(path) if path else None, "battery_pct": drone.state.battery_pct}
 
-def cmd_seed_drop(field, ai, drone, api, db, kg:float, seed_type:str, x:int, y:int):
+@perf.timed("cmd.seed_drop")
+def cmd_seed_drop(field, raster, drone, api, db, kg:float, seed_type:str, x:int, y:int):
     if not field.in_bounds(x,y):
         print(f"[ERROR] Spot {x}x{y} is outside the field.")
-        return
-    h, feats, preds = matrix_value(ai, x,y)
+        return {"error": f"Spot {x}x{y} is outside the field"}
+    h, feats, preds = matrix_value(raster, x,y)
     if h == 1:
         print(f"[ADVISORY] Zone {x}x{y} looks harvestable already (Matrix=1). Seeding skipped by policy.")
         db.log_action("SEED_SKIP", x,y,kg, notes=f"{seed_type} (area looks harvestable)")
-        return
+        return {"x": x, "y": y, "kg": kg, "seed_type": seed_type, "skipped": "harvestable"}
     lat, lon = field.cell_center_geo(x,y)
     start = (drone.state.x, drone.state.y); goal = (x,y)
     path = drone.plan_path(start, goal)
     if path is None:
         print("[WARN] No collision-free path found (simulation). Attempting direct flight.")
     else:
-        print(f"[ROUTE] Steps: {len(path)}")
+        drone.fly(path)
+        print(f"[ROUTE] Steps: {len(path)} (battery {drone.state.battery_pct:.1f}%)")
     api.go_to(x,y,lat,lon)
     api.seed_drop(kg, seed_type)
     db.log_action("SEED_DROP", x,y,kg, notes=f"{seed_type}")
     print(f"[OK] Dropped {kg:.2f} kg of {seed_type} seeds at {x}x{y}.")
+    return {"x": x, "y": y, "kg": kg, "seed_type": seed_type, "steps": len(path) if path else None,
+            "battery_pct": drone.state.battery_pct}
+
+def mission_targets(field, raster, db, action:str, targets, kg:float, seed_type:str):
+    targets = list(dict.fromkeys(targets))
+    outside = [t for t in targets if not field.in_bounds(*t)]
+    for x, y in outside:
+        print(f"[ERROR] Spot {x}x{y} is outside the field.")
+    targets = [t for t in targets if field.in_bounds(*t)]
+    if action == "drop" and targets:
+        _, preds = raster.lookup([t[0] for t in targets], [t[1] for t in targets])
+        for (x, y), h in zip(targets, preds["harvestable"]):
+            if h == 1:
+                print(f"[ADVISORY] Zone {x}x{y} looks harvestable already (Matrix=1). Seeding skipped by policy.")
+                db.log_action("SEED_SKIP", x,y,kg, notes=f"{seed_type} (area looks harvestable)")
+        targets = [t for t, h in zip(targets, preds["harvestable"]) if h != 1]
+    if not targets:
+        print("[WARN] Nothing to do.")
+    return targets
+
+@perf.timed("cmd.mission")
+def cmd_mission(field, raster, drone, api, db, action:str, targets, kg:float = 0.0, seed_type:str = ""):
+    targets = mission_targets(field, raster, db, action, targets, kg, seed_type)
+    if not targets:
+        return {"error": "no targets"}
+    t0 = time.perf_counter()
+    mission = drone.plan_mission(targets)
+    print(f"[MISSION] {len(mission.order)} stops in {len(mission.sorties)} sortie(s), "
+          f"{mission.distance:,} cells planned in {time.perf_counter() - t0:.2f}s")
+    for i in mission.skipped:
+        x, y = mission.targets[i]
+        print(f"[WARN] Zone {x}x{y} is unreachable or beyond one battery charge from base; skipped.")
+    def arrive(i):
+        x, y = mission.targets[i]
+        if action == "soil":
+            api.collect_soil_sample()
+            db.log_action("SOIL_SAMPLE", x,y, notes="Mission soil sample")
+        else:
+            api.seed_drop(kg, seed_type)
+            db.log_action("SEED_DROP", x,y,kg, notes=f"{seed_type} (mission)")
+    flown = drone.execute_mission(mission, api, field.cell_center_geo, on_arrive=arrive)
+    print(f"[OK] Mission complete: {len(mission.order)} stops, {flown:,} cells flown, "
+          f"battery {drone.state.battery_pct:.1f}% at {drone.state.x}x{drone.state.y}.")
+    return {"stops": len(mission.order), "sorties": len(mission.sorties), "planned": mission.distance, "flown": flown,
+            "skipped": [list(mission.targets[i]) for i in mission.skipped], "battery_pct": drone.state.battery_pct}
 
-def cmd_render3d(field, ai, db, cfg, x:int, y:int):
+def make_fleet(cfg, drone, db, field):
+    fcfg = cfg.get("fleet", {})
+    return Fleet(drone, fcfg.get("drones", 4), db=db, geo=field.cell_center_geo, workers=fcfg.get("workers"),
+                 speed_cells_per_s=fcfg.get("speed_cells_per_s", 10.0), soil_sample_s=fcfg.get("soil_sample_s", 60.0),
+                 seed_drop_s=fcfg.get("seed_drop_s", 20.0), charge_s=fcfg.get("charge_s", 1800.0))
+
+@perf.timed("cmd.fleet")
+def cmd_fleet(field, raster, fleet, db, action:str, targets, kg:float = 0.0, seed_type:str = ""):
+    targets = mission_targets(field, raster, db, action, targets, kg, seed_type)
+    if not targets:
+        return {"error": "no targets"}
+    actions = [FleetAction(action, x, y, kg, seed_type) for x, y in targets]
+    report = asyncio.run(fleet.run(actions))
+    for r in report.results:
+        if not r.ok:
+            print(f"[WARN] {r.drone}: no route to {r.action.x}x{r.action.y}; skipped.")
+    per_drone = {}
+    for r in report.results:
+        per_drone[r.drone] = per_drone.get(r.drone, 0) + r.ok
+    print(f"[FLEET] {report.completed}/{len(actions)} actions by {len(fleet.drones)} drones in "
+          f"{report.makespan_s / 3600:.2f} simulated h ({report.actions_per_hour:.1f} actions/h; {report.wall_s:.2f}s wall)")
+    print("  " + ", ".join(f"{name}: {n}" for name, n in sorted(per_drone.items())))
+    return {"completed": report.completed, "actions": len(actions), "makespan_h": report.makespan_s / 3600,
+            "actions_per_hour": report.actions_per_hour, "per_drone": per_drone}
+
+@perf.timed("cmd.render3d")
+def cmd_render3d(field, raster, db, cfg, x:int, y:int):
     if not field.in_bounds(x,y):
         print(f"[ERROR] Spot {x}x{y} is outside the field.")
-        return
+        return {"error": f"Spot {x}x{y} is outside the field"}
     k = cfg["visualization"]["neighborhood"]
     xs, ys = neighborhood_window(x,y,k)
     xs = [xx for xx in xs if 0 <= xx < field.cfg.max_x]
     ys = [yy for yy in ys if 0 <= yy < field.cfg.max_y]
-    Z = np.zeros((len(ys), len(xs)), dtype=float)
-    for i, yy in enumerate(ys):
-        for j, xx in enumerate(xs):
-            _, feats, preds = matrix_value(ai, xx, yy)
-            Z[i,j] = preds["yield_sqft"]
+    _, preds = raster.window(xs[0], ys[0], xs[-1] + 1, ys[-1] + 1)
+    Z = preds["yield_sqft"]
     out = os.path.join("outputs", f"3d_{x}x{y}.png")
     path = plot_3d_surface(Z, title=f"3D Yield around {x}x{y}", save_path=out)
     print(f"[OK] Rendered 3D analysis to: {path}")
+    return {"path": path}
 
-def cmd_metrics(field, ai, db):
-    stride = max(1, field.cfg.max_x // 128)
-    harvestable_count = 0; yield_sum = 0.0; samples = 0
-    for y in range(0, field.cfg.max_y, stride):
-        for x in range(0, field.cfg.max_x, stride):
-            h, feats, preds = matrix_value(ai, x,y)
-            harvestable_count += h; yield_sum += preds["yield_sqft"]; samples += 1
-    avg_yield = yield_sum / samples if samples else 0.0
+@perf.timed("cmd.metrics")
+def cmd_metrics(field, raster, db, cfg, mode=None, n=None, tiles=None):
+    mcfg = cfg.get("metrics", {})
+    mode = mode or mcfg.get("mode", "sample")
+    if mode == "incremental" and tiles is None:
+        mode = "sample"
     total_cells = field.cfg.max_x * field.cfg.max_y
-    est_harvestable_cells = int(harvestable_count * (total_cells / samples))
-    total_harvest_potential = avg_yield * total_cells
-    db.write_metrics(total_harvest_potential, None, avg_yield)
-    print("[METRICS]")
-    print(f"  Estimated harvestable sq-ft: {est_harvestable_cells:,} / {total_cells:,}")
-    print(f"  Average yield per sq-ft: {avg_yield:.3f} kg")
+    t0 = time.perf_counter()
+    tracked = samples = None  # how the snapshot was estimated; deltas only compare equal ones
+    if mode == "incremental":
+        # tracked tiles exactly, the rest (if any) sampled
+        known, rest = tiles.coverage()
+        tracked = tiles.n_tiles - len(rest)
+        coverage = f"{tiles.n_tiles - len(rest)}/{tiles.n_tiles} tiles tracked"
+        est = None
+        if rest:
+            est = sampled_field_metrics(field.cfg, raster.lookup, n=n or mcfg.get("samples", 16384),
+                                        seed=cfg["simulation"]["seed"], boxes=[raster.tile_bounds(*t) for t in rest])
+        rest_cells = est.total_cells if est else 0
+        samples = est.samples if est else None
+        total_harvest_potential = known.yield_sum + (est.total_harvest_potential if est else 0.0)
+        avg_yield = total_harvest_potential / total_cells
+        care_share = (known.care_hist + (est.care_share * rest_cells if est else 0)) / total_cells
+        if est:
+            harvestable_line = (f"{known.harvestable + est.harvestable_cells:,.0f} ± {est.harvestable_ci:,.0f} / {total_cells:,} "
+                                f"({coverage}, rest from {est.samples:,} samples)")
+            yield_line = f"{avg_yield:.3f} ± {est.avg_yield_ci * rest_cells / total_cells:.3f} kg"
+        else:
+            harvestable_line = f"{known.harvestable:,} / {total_cells:,} (exact, {coverage})"
+            yield_line = f"{avg_yield:.3f} kg"
+    elif mode == "exact":
+        if tiles is not None:
+            tiles.backfill(raster.ai, workers=mcfg.get("workers"))
+            totals = tiles.totals()
+            tracked = tiles.n_tiles
+        else:
+            totals = exact_field_metrics(field.cfg, raster.ai, workers=mcfg.get("workers"), band_rows=mcfg.get("band_rows", 64))
+        avg_yield = totals.avg_yield
+        total_harvest_potential = totals.yield_sum
+        care_share = totals.care_hist / max(1, totals.cells)
+        harvestable_line = f"{totals.harvestable:,} / {total_cells:,} (exact)"
+        yield_line = f"{avg_yield:.3f} kg"
+    else:
+        est = sampled_field_metrics(field.cfg, raster.lookup, n=n or mcfg.get("samples", 16384), seed=cfg["simulation"]["seed"])
+        samples = est.samples
+        avg_yield = est.avg_yield
+        total_harvest_potential = est.total_harvest_potential
+        care_share = est.care_share
+        harvestable_line = f"{est.harvestable_cells:,.0f} ± {est.harvestable_ci:,.0f} / {total_cells:,} (95% CI, {est.samples:,} samples)"
+        yield_line = f"{avg_yield:.3f} ± {est.avg_yield_ci:.3f} kg"
+    prev = db.last_metrics(mode, tracked, samples)
+    prev_total = prev["total_harvest_potential"] if prev else None
+    efficiency = (total_harvest_potential - prev_total) / prev_total * 100 if prev_total else None
+    db.write_metrics(total_harvest_potential, efficiency, avg_yield, mode=mode, tracked_tiles=tracked, samples=samples)
+    print(f"[METRICS] ({mode}, {time.perf_counter() - t0:.2f}s)")
+    print(f"  Harvestable sq-ft: {harvestable_line}")
+    print(f"  Average yield per sq-ft: {yield_line}")
     print(f"  Total harvest potential (field): {total_harvest_potential:,.0f} kg")
+    if efficiency is not None:
+        print(f"  vs previous {mode} snapshot with the same coverage ({prev['ts'][:19]}): {efficiency:+.2f}%")
+    print("  Care mix: " + ", ".join(f"{CARE_LABELS[i]} {share*100:.1f}%" for i, share in enumerate(care_share)))
+    return {"mode": mode, "avg_yield": avg_yield, "total_harvest_potential": total_harvest_potential,
+            "efficiency_vs_prev_pct": efficiency, "care_share": {CARE_LABELS[i]: float(share) for i, share in enumerate(care_share)}}
+
+def cmd_perf(db, cfg):
+    perf.report()
+    if not perf.enabled():
+        return {"enabled": False}
+    n = perf.export_sqlite(db)
+    path = perf.export_prometheus(cfg.get("perf", {}).get("prometheus", os.path.join("outputs", "afds_perf.prom")))
+    print(f"[OK] Exported {n} series to the perf table and {path}")
+    return {"enabled": True, "series": perf.snapshot(), "prometheus": path}
 
 def print_help():
     print("""
@@ -132,41 +342,213 @@ Available commands:
   collect soil zone <X>x<Y>
   drop <KG> kg <SEEDTYPE> seeds at <X>x<Y>
   render 3d <X>x<Y>
-  metrics
+  mission soil <X>x<Y> [<X>x<Y> ...]
+  mission drop <KG> kg <SEEDTYPE> seeds at <X>x<Y> [<X>x<Y> ...]
+  fleet soil | fleet drop ...   (same targets, spread over the drone fleet)
+  metrics [incremental | exact | sample <N>]
+  perf
 Examples:
   situation zone 33x33
   collect soil zone 79x79
   drop 2 kg wheat seeds at 5900x15000
   render 3d 999x999
+  mission soil 100x100 900x250 2000x1800
 """)
 
-def main():
-    cfg = load_config("config.json")
-    field, ai, drone, api, db = setup(cfg)
-    print_help()
-    while True:
+def dispatch(ctx: dict, cmd: str, args: dict):
+    # subsystems are looked up per command so e.g. a seed drop never loads the raster's tiles
+    cfg = ctx["cfg"]
+    if cmd == "situation":
+        return cmd_situation(ctx["field"], ctx["raster"], ctx["db"], args["x"], args["y"])
+    if cmd == "collect_soil":
+        return cmd_collect_soil(ctx["field"], ctx["drone"], ctx["api"], ctx["db"], args["x"], args["y"])
+    if cmd == "seed_drop":
+        return cmd_seed_drop(ctx["field"], ctx["raster"], ctx["drone"], ctx["api"], ctx["db"],
+                             args["kg"], args["seed_type"], args["x"], args["y"])
+    if cmd == "mission":
+        return cmd_mission(ctx["field"], ctx["raster"], ctx["drone"], ctx["api"], ctx["db"], args["action"], args["targets"],
+                           args.get("kg", 0.0), args.get("seed_type", ""))
+    if cmd == "fleet":
+        if ctx.get("fleet") is None:
+            ctx["fleet"] = make_fleet(cfg, ctx["drone"], ctx["db"], ctx["field"])
+        return cmd_fleet(ctx["field"], ctx["raster"], ctx["fleet"], ctx["db"], args["action"], args["targets"],
+                         args.get("kg", 0.0), args.get("seed_type", ""))
+    if cmd == "render3d":
+        return cmd_render3d(ctx["field"], ctx["raster"], ctx["db"], cfg, args["x"], args["y"])
+    if cmd == "metrics":
+        return cmd_metrics(ctx["field"], ctx["raster"], ctx["db"], cfg, args.get("mode"), args.get("n"), tiles=ctx["tiles"])
+    if cmd == "perf":
+        return cmd_perf(ctx["db"], cfg)
+    print("[ERROR] Unknown command. Type `help`.")
+    return {"error": "unknown command"}
+
+def make_context(cfg) -> dict:
+    setup(cfg)
+    return Context(cfg)
+
+def close_context(ctx: dict):
+    if ctx.get("fleet") is not None:
+        ctx["fleet"].close()
+    if perf.enabled() and perf.snapshot():
+        perf.export_sqlite(ctx["db"])
+        perf.export_prometheus(ctx["cfg"].get("perf", {}).get("prometheus", os.path.join("outputs", "afds_perf.prom")))
+    if "db" in ctx:
+        ctx["db"].close()
+
+# --- batch mode ------------------------------------------------------------------------
+
+# commands in one lane run in input order; lanes run concurrently. Everything that moves the
+# drone shares a lane because each leg starts where the previous one ended.
+BATCH_LANES = {"situation": "field", "render3d": "render",
+               "collect_soil": "drone", "seed_drop": "drone", "mission": "drone", "fleet": "drone"}
+# report on what the commands before them changed (tile fills, DB rows, timings): they wait for
+# every earlier command, and later ones wait for them
+BATCH_BARRIERS = {"metrics", "perf"}
+
+def _json_default(o):
+    if isinstance(o, np.generic):
+        return o.item()
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    return str(o)
+
+def run_batch(ctx: dict, lines, out, chunk: int = 4096, workers: int = 2):
+    """Run commands from ``lines``, writing one JSON record per command to ``out``.
+
+    ``situation`` queries are grouped ``chunk`` at a time and evaluated with one batched
+    lookup; records carry the input line number since lanes finish out of order.
+    ``metrics`` and ``perf`` see exactly the commands above them (BATCH_BARRIERS).
+    Returns per-command stats and the wall time."""
+    from concurrent.futures import ThreadPoolExecutor
+    import threading
+    lanes = {name: ThreadPoolExecutor(max_workers=workers if name == "field" else 1, thread_name_prefix=f"batch-{name}")
+             for name in set(BATCH_LANES.values())}
+    lock = threading.Lock()
+    stats = {}
+
+    def emit(cmd, records, seconds):
+        with lock:
+            st = stats.setdefault(cmd, {"count": 0, "errors": 0, "busy_s": 0.0})
+            st["count"] += len(records); st["busy_s"] += seconds
+            for rec in records:
+                st["errors"] += not rec["ok"]
+                out.write(json.dumps(rec, default=_json_default) + "\n")
+
+    def run_one(lineno, cmd, args):
+        t0 = time.perf_counter()
         try:
-            s = input("\n> ").strip()
-        except (EOFError, KeyboardInterrupt):
-            print("\n[EXIT] Bye.")
-            break
-        cmd, args = parse_command(s)
+            result = dispatch(ctx, cmd, args) or {}
+        except Exception as e:
+            result = {"error": f"{type(e).__name__}: {e}"}
+        dt = time.perf_counter() - t0
+        emit(cmd, [{"line": lineno, "cmd": cmd, "ok": "error" not in result, "ms": dt * 1e3, "result": result}], dt)
+
+    def run_situations(group):
+        t0 = time.perf_counter()
+        try:
+            results = batch_situation(ctx["field"], ctx["raster"], ctx["db"], [(a["x"], a["y"]) for _, a in group])
+        except Exception as e:
+            results = [{"error": f"{type(e).__name__}: {e}"}] * len(group)
+        dt = time.perf_counter() - t0
+        emit("situation", [{"line": lineno, "cmd": "situation", "ok": "error" not in r, "ms": dt * 1e3 / len(group),
+                            "batch": len(group), "result": r} for (lineno, _), r in zip(group, results)], dt)
+
+    t0 = time.perf_counter()
+    futures, group = [], []
+    for lineno, raw in enumerate(lines, 1):
+        raw = raw.strip()
+        if not raw or raw.startswith("#"):
+            continue
+        cmd, args = parse_command(raw)
         if cmd == "exit":
-            print("[EXIT] Bye."); break
-        elif cmd == "help":
-            print_help()
-        elif cmd == "situation":
-            cmd_situation(field, ai, db, args["x"], args["y"])
-        elif cmd == "collect_soil":
-            cmd_collect_soil(field, ai, drone, api, db, args["x"], args["y"])
-        elif cmd == "seed_drop":
-            cmd_seed_drop(field, ai, drone, api, db, args["kg"], args["seed_type"], args["x"], args["y"])
-        elif cmd == "render3d":
-            cmd_render3d(field, ai, db, cfg, args["x"], args["y"])
-        elif cmd == "metrics":
-            cmd_metrics(field, ai, db)
+            break
+        if cmd == "help":
+            continue
+        if cmd == "situation":
+            group.append((lineno, args))
+            if len(group) >= chunk:
+                futures.append(lanes["field"].submit(run_situations, group)); group = []
+        elif cmd in BATCH_BARRIERS:
+            if group:
+                futures.append(lanes["field"].submit(run_situations, group)); group = []
+            for fut in futures:
+                fut.result()
+            futures = []
+            run_one(lineno, cmd, args)
+        elif cmd in BATCH_LANES:
+            futures.append(lanes[BATCH_LANES[cmd]].submit(run_one, lineno, cmd, args))
         else:
-            print("[ERROR] Unknown command. Type `help`.")
+            emit(cmd, [{"line": lineno, "cmd": cmd, "ok": False, "ms": 0.0, "result": {"error": f"unknown command: {raw}"}}], 0.0)
+    if group:
+        futures.append(lanes["field"].submit(run_situations, group))
+    for fut in futures:
+        fut.result()
+    for pool in lanes.values():
+        pool.shutdown()
+    out.flush()
+    return stats, time.perf_counter() - t0
+
+def print_batch_report(stats: dict, wall: float, file):
+    total = sum(st["count"] for st in stats.values())
+    print(f"[BATCH] {total:,} commands in {wall:.2f}s ({total / wall if wall else 0.0:,.0f} cmd/s)", file=file)
+    for cmd, st in sorted(stats.items()):
+        per = st["busy_s"] / st["count"] * 1e3 if st["count"] else 0.0
+        rate = st["count"] / st["busy_s"] if st["busy_s"] else float("inf")
+        print(f"  {cmd:<13} {st['count']:>8,}  errors {st['errors']:>5,}  {per:8.3f} ms/cmd  {rate:>10,.0f} cmd/s",
+              file=file)
+
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="AFDS simulation console")
+    ap.add_argument("--batch", metavar="FILE", help="run commands from FILE ('-' for stdin) and exit")
+    ap.add_argument("--out", default="-", help="JSON Lines results for --batch (default: stdout)")
+    ap.add_argument("--chunk", type=int, default=4096, help="situation queries evaluated per batch")
+    ap.add_argument("--workers", type=int, default=2, help="threads for batched situation queries")
+    ap.add_argument("--echo", action="store_true", help="show command output on stderr in --batch mode")
+    opts = ap.parse_args(argv)
+    cfg = load_config("config.json")
+    if cfg.get("perf", {}).get("enabled"):
+        perf.enable()
+    if opts.batch:
+        return batch_main(cfg, opts)
+    ctx = make_context(cfg)
+    print_help()
+    try:
+        while True:
+            try:
+                s = input("\n> ").strip()
+            except (EOFError, KeyboardInterrupt):
+                print("\n[EXIT] Bye.")
+                break
+            cmd, args = parse_command(s)
+            if cmd == "exit":
+                print("[EXIT] Bye."); break
+            elif cmd == "help":
+                print_help()
+            else:
+                dispatch(ctx, cmd, args)
+    finally:
+        close_context(ctx)
+
+def batch_main(cfg, opts):
+    import sys, contextlib
+    os.environ["MPLBACKEND"] = "Agg"  # renders happen on a worker thread, never on screen
+    out = sys.stdout if opts.out == "-" else open(opts.out, "w", encoding="utf-8")
+    src = sys.stdin if opts.batch == "-" else open(opts.batch, encoding="utf-8")
+    chatter = sys.stderr if opts.echo else open(os.devnull, "w")
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            ctx = make_context(cfg)
+        try:
+            with contextlib.redirect_stdout(chatter):
+                stats, wall = run_batch(ctx, src, out, chunk=opts.chunk, workers=opts.workers)
+        finally:
+            close_context(ctx)
+        print_batch_report(stats, wall, sys.stderr)
+    finally:
+        for f in (out, src, chatter):
+            if f not in (sys.stdout, sys.stdin, sys.stderr):
+                f.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,161 @@
+from __future__ import annotations
+import os, time, random, threading, functools
+from datetime import datetime
+
+# Instrumentation is off unless AFDS_PERF=1 or perf.enable() is called. Disabled timers return
+# a shared no-op context manager and decorated functions pay one global lookup per call.
+_enabled = os.environ.get("AFDS_PERF", "") not in ("", "0", "false")
+_lock = threading.Lock()
+_series = {}
+
+RESERVOIR = 4096  # samples kept per series for quantiles
+
+class Series:
+    """Count/sum/max plus a fixed-size uniform reservoir for p50/p95/p99."""
+
+    def __init__(self, name: str, kind: str, unit: str):
+        self.name = name
+        self.kind = kind    # "timer", "histogram" or "counter"
+        self.unit = unit
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.samples = []
+        self._rng = random.Random(0)
+
+    def add(self, value: float):
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+        if len(self.samples) < RESERVOIR:
+            self.samples.append(value)
+        else:
+            j = self._rng.randrange(self.count)
+            if j < RESERVOIR:
+                self.samples[j] = value
+
+    def snapshot(self) -> dict:
+        s = sorted(self.samples)
+        pick = lambda q: s[min(len(s) - 1, int(q * len(s)))] if s else 0.0
+        return {"name": self.name, "kind": self.kind, "unit": self.unit, "count": self.count, "sum": self.sum,
+                "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": self.max}
+
+def enabled() -> bool:
+    return _enabled
+
+def enable(on: bool = True):
+    global _enabled
+    _enabled = on
+
+def reset():
+    with _lock:
+        _series.clear()
+
+def _get(name: str, kind: str, unit: str) -> Series:
+    s = _series.get(name)
+    if s is None:
+        s = _series.setdefault(name, Series(name, kind, unit))
+    return s
+
+def observe(name: str, value: float, unit: str = ""):
+    if _enabled:
+        with _lock:
+            _get(name, "histogram", unit).add(value)
+
+def count(name: str, n: float = 1):
+    if _enabled:
+        with _lock:
+            s = _get(name, "counter", "")
+            s.count += 1
+            s.sum += n
+
+class _Timer:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        dt = time.perf_counter() - self.t0
+        with _lock:
+            _get(self.name, "timer", "seconds").add(dt)
+        return False
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_TIMER = _NoTimer()
+
+def timer(name: str):
+    """``with perf.timer("db.commit"): ...`` records the block's wall time."""
+    return _Timer(name) if _enabled else _NO_TIMER
+
+def timed(name: str):
+    """Decorator form of timer()."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Timer(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+def snapshot() -> list:
+    with _lock:
+        return [s.snapshot() for _, s in sorted(_series.items())]
+
+def report(file=None):
+    rows = snapshot()
+    if not rows:
+        print("[PERF] nothing recorded" + ("" if _enabled else " (instrumentation disabled; set perf.enabled)"), file=file)
+        return
+    print(f"[PERF] {'series':<28} {'count':>9} {'p50':>10} {'p95':>10} {'p99':>10} {'max':>10} {'total':>10}", file=file)
+    for r in rows:
+        if r["kind"] == "counter":
+            print(f"  {r['name']:<28} {r['count']:>9,} {'':>43} {r['sum']:>10,.0f}", file=file)
+            continue
+        scale, unit = (1e3, "ms") if r["unit"] == "seconds" else (1.0, "")
+        cells = " ".join(f"{r[k] * scale:>8.3f}{unit:<2}" for k in ("p50", "p95", "p99", "max"))
+        print(f"  {r['name']:<28} {r['count']:>9,} {cells} {r['sum'] * scale:>8.1f}{unit:<2}", file=file)
+
+def export_prometheus(path: str) -> str:
+    """Write the current series in Prometheus text format (summaries and counters)."""
+    lines = []
+    for r in snapshot():
+        metric = "afds_" + "".join(c if c.isalnum() else "_" for c in r["name"])
+        if r["kind"] == "counter":
+            lines += [f"# TYPE {metric}_total counter", f"{metric}_total {r['sum']:.17g}"]
+            continue
+        if r["unit"]:
+            metric += "_" + r["unit"]
+        lines.append(f"# TYPE {metric} summary")
+        for q in ("p50", "p95", "p99"):
+            lines.append(f'{metric}{{quantile="0.{q[1:]}"}} {r[q]:.17g}')
+        lines += [f"{metric}_sum {r['sum']:.17g}", f"{metric}_count {r['count']}"]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)  # scrapers never see a partial file
+    return path
+
+def export_sqlite(db) -> int:
+    """Append the current series to the ``perf`` table of ``db`` (a database.DB)."""
+    ts = datetime.utcnow().isoformat()
+    rows = [(ts, r["name"], r["kind"], r["unit"], r["count"], r["sum"], r["p50"], r["p95"], r["p99"], r["max"])
+            for r in snapshot()]
+    db.write_perf(rows)
+    return len(rows)
@@ -0,0 +1,202 @@
+from __future__ import annotations
+import os, json, shutil, hashlib, threading
+from collections import OrderedDict
+from dataclasses import asdict
+import numpy as np
+
+from field import FieldGrid
+from utils import deterministic_features_for_bbox, deterministic_features_for_region
+
+FEATURE_VERSION = "splitmix64-v1"
+PRED_FIELDS = ("harvestable", "care_label", "yield_sqft", "water_req_pct", "nutrient_req_pct", "fertilizer_req_pct", "parasite_pct")
+INT_FIELDS = ("harvestable", "care_label")
+FLOAT_FIELDS = tuple(name for name in PRED_FIELDS if name not in INT_FIELDS)
+N_FEATS = 7
+# one record per cell; labels are small non-negative ints (98 bytes a cell instead of 14 float64s)
+CELL_DTYPE = np.dtype([("feats", np.float64, (N_FEATS,)), ("preds", np.float64, (len(FLOAT_FIELDS),)),
+                       ("labels", np.uint8, (len(INT_FIELDS),))])
+TILE_LAYOUT = "cells-v2"
+
+class FieldRaster:
+    """Per-cell features + predictions stored in fixed-size memory-mapped tiles.
+
+    Tiles are filled on first touch and kept behind an LRU bounded by ``memory_mb``.
+    A fill runs outside the cache lock, so lookups on resident tiles don't wait for it;
+    threads that need the same missing tile wait for the one filling it. The tile
+    directory is keyed by the model artifact, the field config, the tile size and layout,
+    so changing any of them starts from an empty raster."""
+
+    def __init__(self, field: FieldGrid, ai, root: str = os.path.join("data", "raster"),
+                 tile: int = 256, memory_mb: float = 256):
+        self.field = field
+        self.ai = ai
+        self.tile = tile
+        self.budget = int(memory_mb * 1024 * 1024)
+        self.key = self.raster_key(field, ai, tile)
+        self.root = root
+        self.dir = os.path.join(root, self.key)
+        self._tiles = OrderedDict()
+        self._resident = 0
+        self.hits = self.misses = self.fills = 0
+        self._lock = threading.Lock()  # tile cache shared by batch worker threads
+        self._filling = {}  # (tx, ty) -> Event set when the thread filling that tile is done
+        self.on_fill = None  # on_fill(tx, ty, preds) after a tile is evaluated, e.g. TileMetrics.set_tile
+        self.on_load = None  # on_load(tx, ty, preds) when an existing tile file is opened, e.g. TileMetrics.adopt
+        self._purge_stale()
+        os.makedirs(self.dir, exist_ok=True)
+
+    @staticmethod
+    def raster_key(field: FieldGrid, ai, tile: int) -> str:
+        blob = json.dumps({"field": asdict(field.cfg), "model": ai.artifact_key(),
+                           "tile": tile, "features": FEATURE_VERSION, "layout": TILE_LAYOUT}, sort_keys=True)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
+
+    def _purge_stale(self):
+        if not os.path.isdir(self.root):
+            return
+        for name in os.listdir(self.root):
+            if name != self.key:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def invalidate(self):
+        with self._lock:
+            self._tiles.clear(); self._resident = 0
+            shutil.rmtree(self.dir, ignore_errors=True)
+            os.makedirs(self.dir, exist_ok=True)
+
+    @property
+    def tiles_x(self) -> int:
+        return -(-self.field.cfg.max_x // self.tile)
+
+    @property
+    def tiles_y(self) -> int:
+        return -(-self.field.cfg.max_y // self.tile)
+
+    def tile_bounds(self, tx: int, ty: int):
+        x0, y0 = tx * self.tile, ty * self.tile
+        return x0, y0, min(x0 + self.tile, self.field.cfg.max_x), min(y0 + self.tile, self.field.cfg.max_y)
+
+    def _tile_path(self, tx: int, ty: int) -> str:
+        return os.path.join(self.dir, f"tile_{tx}_{ty}.npy")
+
+    def has_tile(self, tx: int, ty: int) -> bool:
+        return (tx, ty) in self._tiles or os.path.exists(self._tile_path(tx, ty))
+
+    def _fill(self, tx: int, ty: int):
+        x0, y0, x1, y1 = self.tile_bounds(tx, ty)
+        feats = deterministic_features_for_bbox(x0, y0, x1, y1)
+        preds = self.ai.predict_batch(feats.reshape(-1, N_FEATS), chunk_size=4096)
+        path = self._tile_path(tx, ty)
+        tmp = path + f".{os.getpid()}.{threading.get_ident()}.tmp"
+        arr = np.lib.format.open_memmap(tmp, mode="w+", dtype=CELL_DTYPE, shape=(y1 - y0, x1 - x0))
+        self._store(arr, feats, preds)
+        arr.flush(); del arr
+        os.replace(tmp, path)  # atomic: readers never see a half-written tile
+        if self.on_fill is not None:
+            self.on_fill(tx, ty, preds)
+
+    def get_tile(self, tx: int, ty: int) -> np.ndarray:
+        key = (tx, ty)
+        while True:
+            with self._lock:
+                arr = self._tiles.get(key)
+                if arr is not None:
+                    self.hits += 1
+                    self._tiles.move_to_end(key)
+                    return arr
+                path = self._tile_path(tx, ty)
+                done = self._filling.get(key)
+                if done is None and os.path.exists(path):
+                    return self._load(tx, ty, path, filled=False)
+                if done is None:
+                    self.misses += 1
+                    done = self._filling[key] = threading.Event()
+                    break
+            done.wait()  # another thread is filling it; then it's resident or on disk
+        try:
+            self._fill(tx, ty)
+        finally:
+            with self._lock:
+                del self._filling[key]
+                self.fills += 1
+            done.set()
+        with self._lock:
+            arr = self._tiles.get(key)
+            return arr if arr is not None else self._load(tx, ty, self._tile_path(tx, ty), filled=True)
+
+    def _load(self, tx: int, ty: int, path: str, filled: bool) -> np.ndarray:
+        # caller holds the lock; filled: this thread just wrote the file (on_fill already ran)
+        arr = np.load(path, mmap_mode="r")
+        if not filled:
+            self.misses += 1
+            if self.on_load is not None:
+                self.on_load(tx, ty, self._split(arr)[1])
+        self._tiles[(tx, ty)] = arr
+        self._resident += arr.nbytes
+        while self._resident > self.budget and len(self._tiles) > 1:
+            _, old = self._tiles.popitem(last=False)
+            self._resident -= old.nbytes
+        return arr
+
+    @staticmethod
+    def _store(cells: np.ndarray, feats: np.ndarray, preds: dict):
+        cells["feats"] = feats.reshape(cells.shape + (N_FEATS,))
+        for i, name in enumerate(FLOAT_FIELDS):
+            cells["preds"][..., i] = np.asarray(preds[name]).reshape(cells.shape)
+        for i, name in enumerate(INT_FIELDS):
+            cells["labels"][..., i] = np.asarray(preds[name]).reshape(cells.shape)
+
+    @staticmethod
+    def _split(cells: np.ndarray):
+        preds = {}
+        for name in PRED_FIELDS:
+            if name in INT_FIELDS:
+                preds[name] = cells["labels"][..., INT_FIELDS.index(name)].astype(int)
+            else:
+                preds[name] = cells["preds"][..., FLOAT_FIELDS.index(name)]
+        return cells["feats"], preds
+
+    def cell(self, x: int, y: int):
+        arr = self.get_tile(x // self.tile, y // self.tile)
+        feats, preds = self._split(np.array(arr[y % self.tile, x % self.tile]))
+        return feats, {k: (int(v) if k in INT_FIELDS else float(v)) for k, v in preds.items()}
+
+    def window(self, x0: int, y0: int, x1: int, y1: int):
+        out = np.empty((y1 - y0, x1 - x0), dtype=CELL_DTYPE)
+        for ty in range(y0 // self.tile, (y1 - 1) // self.tile + 1):
+            for tx in range(x0 // self.tile, (x1 - 1) // self.tile + 1):
+                bx0, by0, bx1, by1 = self.tile_bounds(tx, ty)
+                ix0, iy0, ix1, iy1 = max(x0, bx0), max(y0, by0), min(x1, bx1), min(y1, by1)
+                arr = self.get_tile(tx, ty)
+                out[iy0 - y0:iy1 - y0, ix0 - x0:ix1 - x0] = arr[iy0 - by0:iy1 - by0, ix0 - bx0:ix1 - bx0]
+        return self._split(out)
+
+    def lookup(self, xs, ys, fill: bool = False):
+        # read cells from tiles that already exist (or fill them); compute the rest without caching
+        xs = np.asarray(xs, dtype=np.int64).reshape(-1); ys = np.asarray(ys, dtype=np.int64).reshape(-1)
+        out = np.empty(len(xs), dtype=CELL_DTYPE)
+        tid = (ys // self.tile) * self.tiles_x + (xs // self.tile)
+        order = np.argsort(tid, kind="stable")
+        bounds = np.flatnonzero(np.diff(tid[order])) + 1
+        missing = []
+        for idx in np.split(order, bounds):
+            if not len(idx):
+                continue
+            ty, tx = divmod(int(tid[idx[0]]), self.tiles_x)
+            if fill or self.has_tile(tx, ty):
+                out[idx] = self.get_tile(tx, ty)[ys[idx] % self.tile, xs[idx] % self.tile]
+            else:
+                missing.append(idx)
+        if missing:
+            idx = np.concatenate(missing)
+            feats = deterministic_features_for_region(xs[idx], ys[idx])
+            preds = self.ai.predict_batch(feats, chunk_size=4096)
+            rows = out[idx]
+            self._store(rows, feats, preds)
+            out[idx] = rows
+        return self._split(out)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "fills": self.fills,
+                "resident_tiles": len(self._tiles), "resident_mb": round(self._resident / 2**20, 1),
+                "budget_mb": round(self.budget / 2**20, 1)}
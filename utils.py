@@ -1,17 +1,21 @@
 \
+import os
 import re
+import sys
 import json
 import math
 import numpy as np
-import matplotlib.pyplot as plt
 from typing import Tuple
 
+import perf
+
 CARE_LABELS = {0: "none", 1:"water", 2:"nutrients", 3:"fertilizer", 4:"parasite"}
 
 def load_config(path="config.json"):
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
+@perf.timed("features.cell")
 def deterministic_features_for_cell(x:int, y:int) -> np.ndarray:
     import hashlib, numpy as np
     seed_bytes = hashlib.sha256(f"{x}:{y}".encode("utf-8")).digest()
@@ -26,10 +30,71 @@ def deterministic_features_for_cell(x:int, y:int) -> np.ndarray:
     humidity = np.clip(55 + 25*math.cos(x/4500) + rng.normal(0, 4.0), 30, 95)
     return np.array([ndvi, moisture, nutrient, parasite, canopy_h, temp, humidity], dtype=float)
 
+_MASK64 = (1 << 64) - 1
+_GOLDEN = 0x9E3779B97F4A7C15
+
+def _splitmix64(z: np.ndarray) -> np.ndarray:
+    # counter-based mixer: same (x, y, k) always gives the same 64-bit word, no RNG state
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def _cell_normals(xs: np.ndarray, ys: np.ndarray, k: int) -> np.ndarray:
+    out = np.empty(xs.shape + (k,), dtype=float)
+    with np.errstate(over="ignore"):  # uint64 wraparound is intended
+        key = (xs.astype(np.uint64) << np.uint64(32)) ^ (ys.astype(np.uint64) & np.uint64(0xFFFFFFFF))
+        key = _splitmix64(key)
+        for i in range(0, k, 2):
+            h1 = _splitmix64(key + np.uint64(((i + 1) * _GOLDEN) & _MASK64))
+            h2 = _splitmix64(key + np.uint64(((i + 2) * _GOLDEN) & _MASK64))
+            u1 = ((h1 >> np.uint64(11)) + np.uint64(1)) * 2.0**-53  # (0, 1]
+            u2 = (h2 >> np.uint64(11)) * 2.0**-53                   # [0, 1)
+            r = np.sqrt(-2.0 * np.log(u1)); t = 2.0 * math.pi * u2
+            out[..., i] = r * np.cos(t)
+            if i + 1 < k:
+                out[..., i + 1] = r * np.sin(t)
+    return out
+
+@perf.timed("features.region")
+def deterministic_features_for_region(xs, ys, legacy: bool = False) -> np.ndarray:
+    """Features for many cells at once; xs/ys broadcast together, result has shape (*shape, 7).
+
+    legacy=True reproduces deterministic_features_for_cell exactly (SHA-256 seeding, slow)."""
+    xs, ys = np.broadcast_arrays(np.asarray(xs, dtype=np.int64), np.asarray(ys, dtype=np.int64))
+    if legacy:
+        out = np.empty(xs.shape + (7,), dtype=float)
+        for idx in np.ndindex(xs.shape):
+            out[idx] = deterministic_features_for_cell(int(xs[idx]), int(ys[idx]))
+        return out
+    n = _cell_normals(xs, ys, 7)
+    fx = xs.astype(float); fy = ys.astype(float)
+    ndvi = np.clip(0.5 + 0.3*np.sin(fx/2000) + 0.2*np.cos(fy/1800) + 0.1*n[..., 0], 0, 1)
+    moisture = np.clip(0.55 + 0.25*np.sin(fy/700) - 0.2*np.cos(fx/900) + 0.1*n[..., 1], 0, 1)
+    nutrient = np.clip(0.6 + 0.2*np.cos(fx/1200+fy/1500) + 0.1*n[..., 2], 0, 1)
+    parasite = np.clip(0.15 + 0.25*np.abs(np.sin(fx/4000)+np.cos(fy/3500)) + 0.1*np.abs(n[..., 3]), 0, 1)
+    canopy_h = np.clip(0.4 + 0.8*ndvi + 0.1*n[..., 4], 0.1, 1.8)
+    temp = 26 + 6*np.sin((fx+fy)/5000) + 1.2*n[..., 5]
+    humidity = np.clip(55 + 25*np.cos(fx/4500) + 4.0*n[..., 6], 30, 95)
+    return np.stack([ndvi, moisture, nutrient, parasite, canopy_h, temp, humidity], axis=-1)
+
+def deterministic_features_for_bbox(x0:int, y0:int, x1:int, y1:int, legacy: bool = False) -> np.ndarray:
+    """Features for the half-open box [x0, x1) x [y0, y1) as an (H, W, 7) array, rows indexed by y."""
+    return deterministic_features_for_region(np.arange(x0, x1)[None, :], np.arange(y0, y1)[:, None], legacy=legacy)
+
+def _cells(s: str):
+    return [(int(x), int(y)) for x, y in re.findall(r"(\d+)x(\d+)", s)]
+
 def parse_command(s: str):
     s = s.strip().lower()
     if s in ("exit", "quit", "q"): return ("exit", {})
     if s in ("help", "?"): return ("help", {})
+    if s in ("perf", "stats"): return ("perf", {})
+    m = re.match(r"(mission|fleet)\s+(?:collect\s+)?soil(?:\s+samples?)?(?:\s+(?:at|in|on|zones?))?((?:\s+\d+x\d+)+)\s*$", s)
+    if m:
+        return (m.group(1), {"action": "soil", "targets": _cells(m.group(2))})
+    m = re.match(r"(mission|fleet)\s+drop\s+(\d+(?:\.\d+)?)\s*(?:kg|kilogram|kilograms)\s+([a-zA-Z0-9_-]+)\s+seeds\s+(?:at|in|on)((?:\s+\d+x\d+)+)\s*$", s)
+    if m:
+        return (m.group(1), {"action": "drop", "kg": float(m.group(2)), "seed_type": m.group(3), "targets": _cells(m.group(4))})
     m = re.search(r"(situation|status).*(?:zone|spot)\s+(\d+)x(\d+)", s)
     if m:
         return ("situation", {"x":int(m.group(2)), "y":int(m.group(3))})
@@ -42,6 +107,10 @@ def parse_command(s: str):
     m = re.search(r"(render|generate).*(3d).*(?:zone|spot)?\s*(\d+)x(\d+)", s)
     if m:
         return ("render3d", {"x":int(m.group(3)), "y":int(m.group(4))})
+    m = re.match(r"metrics(?:\s+(incremental|exact|sample|sampled)(?:\s+(\d+))?)?\s*$", s)
+    if m:
+        mode = {"sampled": "sample"}.get(m.group(1), m.group(1))
+        return ("metrics", {"mode": mode, "n": int(m.group(2)) if m.group(2) else None})
     if s.strip().startswith("metrics"):
         return ("metrics", {})
     return ("unknown", {"raw": s})
@@ -53,9 +122,20 @@ def neighborhood_window(center_x:int, center_y:int, k:int):
     ys = list(range(center_y - half, center_y + half + 1))
     return xs, ys
 
-def plot_3d_surface(Z, title="3D Analysis", save_path="outputs/3d.png"):
+def can_show_plots() -> bool:
+    # a window only makes sense for a console session on a machine with a display
+    if not (sys.stdin.isatty() and sys.stdout.isatty()):
+        return False
+    return os.name == "nt" or sys.platform == "darwin" or bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+def plot_3d_surface(Z, title="3D Analysis", save_path="outputs/3d.png", show=None):
+    # matplotlib is imported on first render; without a window to show, render headless (Agg)
+    import matplotlib
+    show = can_show_plots() if show is None else show
+    if not show:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
     from mpl_toolkits.mplot3d import Axes3D  # noqa: F401
-    import os
     os.makedirs(os.path.dirname(save_path), exist_ok=True)
     fig = plt.figure(figsize=(8,6))
     ax = fig.add_subplot(111, projection='3d')
@@ -64,8 +144,10 @@ def plot_3d_surface(Z, title="3D Analysis", save_path="outputs/3d.png"):
     ax.plot_surface(X, Y, Z, cmap="viridis", linewidth=0, antialiased=True)
     ax.set_title(title); ax.set_xlabel("Δx"); ax.set_ylabel("Δy"); ax.set_zlabel("Yield (kg/sqft)")
     fig.tight_layout(); fig.savefig(save_path, dpi=200)
-    try: plt.show()
-    except Exception: pass
+    if show and matplotlib.get_backend().lower() != "agg":
+        try: plt.show()
+        except Exception: pass
+    plt.close(fig)
     return save_path
 
 def env_snapshot():